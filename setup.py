@@ -39,6 +39,9 @@ setup(
     ],
     install_requires=get_requirements(),
     python_requires=">=3.6",
+    entry_points={
+        "console_scripts": ["pushcollector-merge = pushcollector._impl.merge:main"]
+    },
     project_urls={
         "Documentation": "https://release-engineering.github.io/pushcollector/",
         "Changelog": "https://github.com/release-engineering/pushcollector/blob/master/CHANGELOG.md",
@@ -1 +1,12 @@
-from pushcollector._impl import Collector
+from pushcollector._impl import (
+    Collector,
+    ChecksumCache,
+    LocalCollector,
+    ObjectStoreCollector,
+    PriorityScheduler,
+    SqliteCollector,
+    read_push_items,
+    jsonl_to_binary,
+    binary_to_jsonl,
+    merge_artifacts,
+)
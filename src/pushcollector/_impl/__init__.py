@@ -1 +1,8 @@
 from .collector import Collector
+from .local import LocalCollector
+from .binary import read_push_items, jsonl_to_binary, binary_to_jsonl
+from .scheduler import PriorityScheduler
+from .objectstore import ObjectStoreCollector
+from .sqlite import SqliteCollector
+from .checksums import ChecksumCache
+from .merge import merge_artifacts
@@ -0,0 +1,361 @@
+import json
+
+# Binary push item format.
+#
+# A file starts with MAGIC, followed by a sequence of records. Each record is:
+#
+#   u8 type, varint length, payload
+#
+# Record types:
+#
+# - STRING: payload is a UTF-8 string, which is appended to the string
+#   dictionary. Strings are referenced from later records by their index
+#   in the dictionary, so each distinct string is stored only once.
+#
+# - ITEM: a single push item, encoded as:
+#
+#   u8 state (index into STATES)
+#   varint filename (string index)
+#   u8 mask of OPTIONAL_FIELDS present in the item
+#   u8 mask of OPTIONAL_FIELDS present with a null value
+#   for each present, non-null field, in OPTIONAL_FIELDS order:
+#     string fields: varint string index
+#     checksums: u8 mask of CHECKSUMS present, followed by raw digests
+#   if EXTRA_BIT is set in the present mask:
+#     varint length, UTF-8 JSON object of any other fields
+#
+# Absent fields and null fields are distinguished so that conversion to and
+# from JSONL is lossless.
+
+MAGIC = b"PCPI\x01"
+
+RECORD_STRING = 0
+RECORD_ITEM = 1
+
+# Codes of push item states, as indexes into this table. The table is part of
+# the file format: existing entries must never be reordered or removed, and
+# states added to the schema must be appended at the end.
+STATES = (
+    # Format version 1
+    "PUSHED",
+    "PENDING",
+    "EXISTS",
+    "DELETED",
+    "MISSING",
+    "SKIPPED",
+    "UNKNOWN",
+    "ONSERVER",
+    "NOTFOUND",
+    "UPLOADFAILED",
+    "INVALIDFILE",
+    "UNSIGNED",
+    "CHECKSUM",
+    "SUBSCRIPTION",
+    "NOTPUSHED",
+    "PUBLISHED",
+    "EXPORTED",
+    "DOCKERTAGMISMATCH",
+)
+STATE_CODES = dict((state, code) for (code, state) in enumerate(STATES))
+
+STRING_FIELDS = ("src", "dest", "origin", "build", "signing_key")
+OPTIONAL_FIELDS = STRING_FIELDS + ("checksums",)
+KNOWN_FIELDS = frozenset(("filename", "state") + OPTIONAL_FIELDS)
+EXTRA_BIT = 1 << len(OPTIONAL_FIELDS)
+
+CHECKSUMS = (("md5", 16), ("sha256", 32))
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def encode_varint(value, out):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buf, pos):
+    # Raises IndexError if buf doesn't hold the complete value.
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class BinaryWriter(object):
+    # Encodes push items into the binary format. A writer holds the string
+    # dictionary, so a single writer must be used for the lifetime of a file;
+    # the first encoded chunk includes the file header.
+    def __init__(self):
+        self._strings = {}
+        self._started = False
+
+    def _string(self, value, out):
+        index = self._strings.get(value)
+        if index is None:
+            index = len(self._strings)
+            self._strings[value] = index
+            self._record(RECORD_STRING, value.encode("utf-8"), out)
+        return index
+
+    @classmethod
+    def _record(cls, record_type, payload, out):
+        out.append(record_type)
+        encode_varint(len(payload), out)
+        out.extend(payload)
+
+    def encode(self, items):
+        chunks = []
+        self.write(chunks.append, items)
+        return chunks[0]
+
+    def write(self, write, items):
+        # Encodes items and passes the encoded chunk to write. Strings added
+        # by this call are kept in the dictionary only if write succeeds,
+        # so that a failed write leaves no dangling string indices.
+        known = len(self._strings)
+        try:
+            out = bytearray()
+            if not self._started:
+                out.extend(MAGIC)
+            for item in items:
+                self._record(RECORD_ITEM, self._encode(item, out), out)
+            write(bytes(out))
+        except Exception:
+            for (value, index) in list(self._strings.items()):
+                if index >= known:
+                    del self._strings[value]
+            raise
+        self._started = True
+
+    def _encode(self, item, out):
+        # Any new strings are written to 'out' before the item itself.
+        try:
+            state = STATE_CODES[item["state"]]
+        except KeyError:
+            raise ValueError("Unknown push item state: %s" % repr(item["state"]))
+
+        payload = bytearray([state])
+        encode_varint(self._string(item["filename"], out), payload)
+
+        present = 0
+        null = 0
+        fields = bytearray()
+        for (bit, field) in enumerate(OPTIONAL_FIELDS):
+            if field not in item:
+                continue
+            present |= 1 << bit
+            value = item[field]
+            if value is None:
+                null |= 1 << bit
+            elif field == "checksums":
+                self._encode_checksums(value, fields)
+            else:
+                encode_varint(self._string(value, out), fields)
+
+        extra = dict((k, v) for (k, v) in item.items() if k not in KNOWN_FIELDS)
+        if extra:
+            present |= EXTRA_BIT
+            extra = json.dumps(extra, sort_keys=True).encode("utf-8")
+            encode_varint(len(extra), fields)
+            fields.extend(extra)
+
+        payload.append(present)
+        payload.append(null)
+        payload.extend(fields)
+        return payload
+
+    @classmethod
+    def _encode_checksums(cls, checksums, out):
+        unknown = set(checksums) - set(name for (name, _) in CHECKSUMS)
+        if unknown:
+            raise ValueError("Unknown checksum type(s): %s" % sorted(unknown))
+
+        mask = 0
+        digests = bytearray()
+        for (bit, (name, _)) in enumerate(CHECKSUMS):
+            if name in checksums:
+                mask |= 1 << bit
+                digests.extend(bytes.fromhex(checksums[name]))
+        out.append(mask)
+        out.extend(digests)
+
+
+def iter_records(file):
+    # Yields (type, payload) for each record in file, holding only the
+    # current chunk (or current record, if larger) in memory.
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a binary push items file")
+
+    buf = b""
+    pos = 0
+    while True:
+        try:
+            record_type = buf[pos]
+            length, start = decode_varint(buf, pos + 1)
+            end = start + length
+            if end > len(buf):
+                raise IndexError()
+        except IndexError:
+            more = file.read(CHUNK_SIZE)
+            if not more:
+                if pos < len(buf):
+                    raise ValueError("Truncated binary push items file")
+                return
+            buf = buf[pos:] + more
+            pos = 0
+            continue
+
+        yield record_type, buf[start:end]
+        pos = end
+
+
+FIELD_NULL = 0
+FIELD_STRING = 1
+FIELD_CHECKSUMS = 2
+
+DECODE_PLANS = {}
+
+
+def decode_plan(present, null):
+    # Items with the same set of fields share a plan, computed once,
+    # listing (field, kind) for each field to be decoded.
+    key = (present, null)
+    plan = DECODE_PLANS.get(key)
+    if plan is None:
+        plan = []
+        for (bit, field) in enumerate(OPTIONAL_FIELDS):
+            if not present & (1 << bit):
+                continue
+            if null & (1 << bit):
+                plan.append((field, FIELD_NULL))
+            elif field == "checksums":
+                plan.append((field, FIELD_CHECKSUMS))
+            else:
+                plan.append((field, FIELD_STRING))
+        plan = DECODE_PLANS[key] = tuple(plan)
+    return plan
+
+
+def decode_item(payload, strings):
+    # Single-byte varints are by far the most common and are decoded inline.
+    item = {"state": STATES[payload[0]]}
+    index = payload[1]
+    pos = 2
+    if index > 0x7F:
+        index, pos = decode_varint(payload, 1)
+    item["filename"] = strings[index]
+    present = payload[pos]
+    pos += 2
+
+    for (field, kind) in decode_plan(present, payload[pos - 1]):
+        if kind == FIELD_STRING:
+            index = payload[pos]
+            pos += 1
+            if index > 0x7F:
+                index, pos = decode_varint(payload, pos - 1)
+            item[field] = strings[index]
+        elif kind == FIELD_NULL:
+            item[field] = None
+        else:
+            mask = payload[pos]
+            pos += 1
+            checksums = {}
+            for (checksum_bit, (name, size)) in enumerate(CHECKSUMS):
+                if mask & (1 << checksum_bit):
+                    checksums[name] = payload[pos : pos + size].hex()
+                    pos += size
+            item[field] = checksums
+
+    if present & EXTRA_BIT:
+        length, pos = decode_varint(payload, pos)
+        item.update(json.loads(payload[pos : pos + length].decode("utf-8")))
+
+    return item
+
+
+def read_binary_push_items(file):
+    strings = []
+    for (record_type, payload) in iter_records(file):
+        if record_type == RECORD_STRING:
+            strings.append(payload.decode("utf-8"))
+        elif record_type == RECORD_ITEM:
+            yield decode_item(payload, strings)
+        else:
+            raise ValueError("Unknown record type in push items file: %s" % record_type)
+
+
+def read_push_items(path):
+    """Read push items from a file written by the "local" backend.
+
+    Parameters:
+        path (str)
+            Path to a push items file, in either JSON Lines or binary format.
+            The format is detected automatically.
+
+    Returns:
+        iterable of dict
+            A generator yielding each push item, in the order they were
+            recorded. Items are read incrementally, so arbitrarily large files
+            may be read with bounded memory.
+
+    .. versionadded:: 1.4.0
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) == MAGIC:
+            file.seek(0)
+            for item in read_binary_push_items(file):
+                yield item
+        else:
+            file.seek(0)
+            for line in file:
+                if line.strip():
+                    yield json.loads(line.decode("utf-8"))
+
+
+def jsonl_to_binary(src, dest):
+    """Convert a push items file from JSON Lines to binary format.
+
+    Parameters:
+        src (str)
+            Path to an existing push items file, in JSON Lines format.
+        dest (str)
+            Path to the binary push items file to be created.
+
+    .. versionadded:: 1.4.0
+    """
+    writer = BinaryWriter()
+    with open(dest, "wb") as file:
+        batch = []
+        for item in read_push_items(src):
+            batch.append(item)
+            if len(batch) >= 1000:
+                file.write(writer.encode(batch))
+                batch = []
+        file.write(writer.encode(batch))
+
+
+def binary_to_jsonl(src, dest):
+    """Convert a push items file from binary to JSON Lines format.
+
+    The output is identical to the file which would have been written by the
+    "local" backend in JSON Lines format.
+
+    Parameters:
+        src (str)
+            Path to an existing push items file, in binary format.
+        dest (str)
+            Path to the JSON Lines push items file to be created.
+
+    .. versionadded:: 1.4.0
+    """
+    with open(dest, "w") as file:
+        for item in read_push_items(src):
+            json.dump(item, file, sort_keys=True)
+            file.write("\n")
@@ -0,0 +1,239 @@
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import stat
+import threading
+
+from more_executors import Executors
+from more_executors.futures import f_map, f_return, f_sequence
+
+LOG = logging.getLogger("pushcollector")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def default_cache_path():
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_dir, "pushcollector", "checksums.db")
+
+
+def stat_key(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def hash_file(path):
+    # Returns (stat key, checksums) for the file at path, computing both
+    # digests in a single pass over a memory mapping of the file.
+    md5 = hashlib.md5()  # nosec - checksum only, not used for security
+    sha256 = hashlib.sha256()
+
+    with open(path, "rb") as file:
+        before = os.fstat(file.fileno())
+        if before.st_size:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    # Chunks are hashed by both digests while still in cache;
+                    # hashlib releases the GIL for large updates, so files
+                    # are hashed in parallel across threads.
+                    for offset in range(0, len(view), CHUNK_SIZE):
+                        with view[offset : offset + CHUNK_SIZE] as chunk:
+                            md5.update(chunk)
+                            sha256.update(chunk)
+                finally:
+                    view.release()
+        after = os.fstat(file.fileno())
+
+    if stat_key(before) != stat_key(after):
+        # Modified while hashing; the result can't be trusted.
+        raise IOError("%s was modified while calculating checksums" % path)
+
+    return stat_key(after), {"md5": md5.hexdigest(), "sha256": sha256.hexdigest()}
+
+
+def try_hash_file(path):
+    # Like hash_file, but returns (path, key, checksums), or None for files
+    # which can't be hashed.
+    try:
+        (key, checksums) = hash_file(path)
+    except Exception as error:  # pylint: disable=broad-except
+        LOG.debug("Can't calculate checksums of %s: %s", path, error)
+        return None
+    return (path, key, checksums)
+
+
+class ChecksumCache(object):
+    """Fills in checksums for push items which don't provide them.
+
+    If passed to :meth:`~pushcollector.Collector.get`, then whenever a push
+    item has a "src" referring to a local file but no "checksums", the md5 and
+    sha256 checksums of that file are calculated and added to the push item.
+
+    Checksums are cached on disk, keyed by each file's device, inode, size
+    and modification time, so that files are only read again if they may
+    have changed. A single cache may be shared between collectors and
+    processes. If the cache database can't be used, e.g. because it's not
+    writable, a warning is logged and checksums are calculated without it.
+
+    Push items are validated before any files are hashed, and files are
+    hashed in the background: ``update_push_items`` returns without waiting
+    for checksums, and the push items are passed to the backend once their
+    checksums are available (in the same order as the calls were made).
+
+    The cache may be used as a context manager, or closed via :meth:`close`
+    once no longer needed, to release its threads and database connection.
+
+    Parameters:
+        path (str)
+            Path to the cache database. Defaults to
+            ``$XDG_CACHE_HOME/pushcollector/checksums.db``.
+
+        workers (int)
+            Maximum number of files for which checksums are calculated
+            concurrently.
+
+    .. versionadded:: 1.4.0
+    """
+
+    def __init__(self, path=None, workers=4):
+        self._path = path or default_cache_path()
+        self._executor = Executors.thread_pool(
+            max_workers=workers, name="pushcollector-checksums"
+        )
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Release resources used by this cache.
+
+        The cache can't be used after it's been closed.
+        """
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self):
+        # Must be called with lock held.
+        if not self._conn:
+            parent_dir = os.path.dirname(os.path.abspath(self._path))
+            if not os.path.exists(parent_dir):
+                os.makedirs(parent_dir)
+            conn = sqlite3.connect(self._path, check_same_thread=False, timeout=30)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                with conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS checksums ("
+                        "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+                        "md5 TEXT NOT NULL, sha256 TEXT NOT NULL, "
+                        "PRIMARY KEY (dev, ino, size, mtime_ns)) WITHOUT ROWID"
+                    )
+            except Exception:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    def enrich(self, items):
+        # Returns a future resolved with items, with checksums filled in where
+        # possible. Items are copied rather than modified. Files are hashed
+        # in the background; only cache lookups happen in the caller.
+        paths = set(
+            item["src"]
+            for item in items
+            if item.get("checksums") is None and isinstance(item.get("src"), str)
+        )
+        if not paths:
+            return f_return(items)
+
+        return f_map(self.get(paths), lambda checksums: self._apply(items, checksums))
+
+    @classmethod
+    def _apply(cls, items, checksums):
+        out = []
+        for item in items:
+            found = None
+            if item.get("checksums") is None and isinstance(item.get("src"), str):
+                found = checksums.get(item["src"])
+            if found:
+                item = item.copy()
+                item["checksums"] = found.copy()
+            out.append(item)
+        return out
+
+    def get(self, paths):
+        # Returns a future resolved with a dict of path => checksums, for
+        # those of the given paths which refer to readable regular files.
+        keys = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                keys[path] = stat_key(st)
+
+        out = {}
+        try:
+            out = self._lookup(keys)
+        except (sqlite3.Error, OSError) as error:
+            # The cache is only an optimization; files are hashed instead.
+            LOG.warning("Can't read checksum cache %s: %s", self._path, error)
+
+        to_hash = [path for path in keys if path not in out]
+
+        if not to_hash:
+            return f_return(out)
+
+        futures = [self._executor.submit(try_hash_file, path) for path in to_hash]
+        return f_map(f_sequence(futures), lambda results: self._store(out, results))
+
+    def _lookup(self, keys):
+        # Returns a dict of path => checksums for those of the given paths
+        # (a dict of path => stat key) which are in the cache.
+        out = {}
+        with self._lock:
+            conn = self._connect()
+            for (path, key) in keys.items():
+                row = conn.execute(
+                    "SELECT md5, sha256 FROM checksums "
+                    "WHERE dev=? AND ino=? AND size=? AND mtime_ns=?",
+                    key,
+                ).fetchone()
+                if row:
+                    out[path] = {"md5": row[0], "sha256": row[1]}
+        return out
+
+    def _store(self, out, results):
+        rows = []
+        for result in results:
+            if result:
+                (path, key, checksums) = result
+                out[path] = checksums
+                rows.append(key + (checksums["md5"], checksums["sha256"]))
+
+        if rows:
+            try:
+                with self._lock:
+                    conn = self._connect()
+                    with conn:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO checksums "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            rows,
+                        )
+            except (sqlite3.Error, OSError) as error:
+                # The checksums are still used, just not cached.
+                LOG.warning("Can't update checksum cache %s: %s", self._path, error)
+
+        return out
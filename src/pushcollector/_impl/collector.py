@@ -1,6 +1,13 @@
+import logging
+
 from .local import LocalCollector
 from .dummy import DummyCollector
+from .sqlite import SqliteCollector
 from .proxy import CollectorProxy
+from .trace import Tracer
+from .entrypoints import backend_entry_points
+
+LOG = logging.getLogger("pushcollector")
 
 
 class Collector(object):
@@ -29,6 +36,12 @@ class Collector(object):
     """
 
     _BACKENDS = {}
+    # Names of all backends registered via register_backend, which take
+    # precedence over any entry point of the same name.
+    _REGISTERED = set()
+    # Entry points of backends not yet loaded; discovered on first lookup
+    # of a backend which isn't registered.
+    _ENTRY_POINTS = None
     _INITIAL_BACKEND = "local"
     _DEFAULT_BACKEND = _INITIAL_BACKEND
 
@@ -88,8 +101,42 @@ class Collector(object):
         """
         raise NotImplementedError()
 
+    def summary(self):
+        """Get a summary of all push items recorded via this collector.
+
+        Only the latest state of each push item, identified by its
+        "filename" and "dest", is taken into account.
+
+        Summaries are maintained incrementally by the library as push items
+        are recorded, so this method is cheap to call and backends don't
+        need to implement it. If any push items were recorded and the backend
+        implements ``attach_file``, the summary is also attached as
+        ``summary.json`` when the collector is exited as a context manager.
+
+        .. versionadded:: 1.4.0
+
+        Returns:
+            dict
+                A dict with the following keys:
+
+                ``total``
+                    Number of distinct push items.
+                ``states``
+                    Count of push items per state.
+                ``successful``, ``unsuccessful``
+                    Same as ``states``, split per the groups documented
+                    in the :ref:`schema`.
+                ``builds``, ``dests``
+                    Count of push items per state, for each build and
+                    destination.
+                ``failures``
+                    A list of dicts with "filename", "dest" and "state" keys,
+                    for every push item in an unsuccessful state.
+        """
+        raise NotImplementedError()
+
     @classmethod
-    def get(cls, backend=None):
+    def get(cls, backend=None, trace=None, scheduler=None, checksum_cache=None):
         """Obtain a collector using the specified backend.
 
         .. versionadded:: 1.3.0
@@ -101,9 +148,45 @@ class Collector(object):
                 If provided, must be the name of an existing pushcollector backend.
                 An instance of this backend will be used.
 
+                If the backend hasn't been registered, it's loaded from the
+                ``pushcollector.backends`` entry point group, if any installed
+                distribution provides a backend of this name.
+
+                .. versionchanged:: 1.4.0
+                   Backends may be provided by entry points.
+
                 If omitted/None, the library's default backend will be used.
                 The default backend is initially set to "local".
 
+            trace (str)
+                If provided, the returned collector records a timeline of each
+                call (argument translation, validation, submission to the
+                backend and resolution of the returned future) and writes it
+                to a file at this path, in Chrome trace event JSON format,
+                when the collector is exited as a context manager.
+
+                Only the most recent 100,000 events are kept; if older events
+                were dropped, a warning is logged when the trace is written.
+
+                .. versionadded:: 1.4.0
+
+            scheduler (:class:`~pushcollector.PriorityScheduler`)
+                If provided, calls to the backend are made asynchronously via
+                this scheduler, with push item updates prioritized over file
+                writes. Exiting the returned collector as a context manager
+                waits for all scheduled calls to complete.
+
+                .. versionadded:: 1.4.0
+
+            checksum_cache (:class:`~pushcollector.ChecksumCache`)
+                If provided, checksums are calculated for push items
+                referring to local files which don't already have checksums,
+                using this cache. Files are hashed in the background, after
+                push items are validated; push items are passed to the
+                backend once their checksums are available.
+
+                .. versionadded:: 1.4.0
+
         Returns:
             :class:`~pushcollector.Collector`
                 An object implementing the ``Collector`` interface, which
@@ -119,7 +202,8 @@ class Collector(object):
 
         factory = cls._BACKENDS[backend]
         instance = factory()
-        return CollectorProxy(instance)
+        tracer = Tracer(trace) if trace else None
+        return CollectorProxy(instance, tracer, scheduler, checksum_cache)
 
     @classmethod
     def register_backend(cls, name, factory):
@@ -146,6 +230,8 @@ class Collector(object):
         if factory is not None and not callable(factory):
             raise TypeError("expected None or callable, got: %s" % repr(factory))
 
+        cls._REGISTERED.add(name)
+
         if factory is None:
             if cls._DEFAULT_BACKEND == name:
                 # Unregistered backend cannot remain the default.
@@ -160,9 +246,9 @@ class Collector(object):
 
         Parameters:
             name (str)
-                The name of a backend registered with the library,
-                or ``None`` to reset the default backend to the library's
-                initial default.
+                The name of a backend registered with the library or
+                provided by an entry point, or ``None`` to reset the default
+                backend to the library's initial default.
 
         Raises:
             ValueError
@@ -174,9 +260,32 @@ class Collector(object):
 
     @classmethod
     def _require_backend(cls, name):
+        if name not in cls._BACKENDS:
+            cls._load_entry_point(name)
         if name not in cls._BACKENDS:
             raise ValueError("No registered pushcollector backend: '%s'" % name)
 
+    @classmethod
+    def _load_entry_point(cls, name):
+        # Backends are imported only once requested, so that unused backends
+        # and their dependencies cost nothing.
+        if name in cls._REGISTERED:
+            # Explicitly registered (or unregistered) backends aren't
+            # replaced by entry points.
+            return
+
+        if cls._ENTRY_POINTS is None:
+            cls._ENTRY_POINTS = backend_entry_points()
+
+        entry_point = cls._ENTRY_POINTS.get(name)
+        if entry_point:
+            LOG.debug(
+                "Loading pushcollector backend '%s' from %s", name, entry_point.value
+            )
+            cls.register_backend(name, entry_point.load())
+            del cls._ENTRY_POINTS[name]
+
 
 Collector.register_backend("local", LocalCollector)
 Collector.register_backend("dummy", DummyCollector)
+Collector.register_backend("sqlite", SqliteCollector)
@@ -0,0 +1,131 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future
+
+LOG = logging.getLogger("pushcollector")
+
+DURABILITY_MODES = ("none", "exit", "periodic", "group")
+
+# fdatasync skips flushing metadata not needed to read the data back, but
+# isn't available on all platforms.
+datasync = getattr(os, "fdatasync", os.fsync)
+
+
+def sync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if os.path.isdir(path):
+            os.fsync(fd)
+        else:
+            datasync(fd)
+    finally:
+        os.close(fd)
+
+
+class Syncer(object):
+    # Tracks files written by a collector and makes them durable according
+    # to the selected mode:
+    #
+    # - none: never sync
+    # - exit: sync all written files when closed
+    # - periodic: sync written files every 'interval' seconds, and when closed
+    # - group: writers are given a future which is resolved once their data
+    #   is durable. A background thread syncs all files written since the
+    #   previous sync at once, so concurrent writers share a single sync.
+    def __init__(self, mode, interval):
+        if mode not in DURABILITY_MODES:
+            raise ValueError("Unsupported durability mode: %s" % repr(mode))
+
+        self._mode = mode
+        self._interval = interval
+        self._cond = threading.Condition()
+        self._dirty = set()
+        self._waiting = []
+        self._thread = None
+        self._stopping = False
+
+    def dirty(self, *paths):
+        # Called when paths were modified in a way which should be made
+        # durable, without any writer waiting for it (e.g. directories).
+        if self._mode != "none":
+            with self._cond:
+                self._dirty.update(paths)
+
+    def written(self, *paths):
+        # Called after content was written to paths. Returns a future
+        # resolved once the content is durable, or None if the caller
+        # needn't wait.
+        if self._mode == "none":
+            return None
+
+        with self._cond:
+            self._dirty.update(paths)
+            if self._mode == "exit":
+                return None
+
+            if not self._thread:
+                self._stopping = False
+                self._thread = threading.Thread(
+                    name="pushcollector-sync", target=self._work, daemon=True
+                )
+                self._thread.start()
+
+            if self._mode == "periodic":
+                return None
+
+            future = Future()
+            self._waiting.append(future)
+            self._cond.notify()
+            return future
+
+    def close(self):
+        # Stops any background thread and syncs anything outstanding.
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify()
+        if thread:
+            thread.join()
+            self._thread = None
+        self._sync()
+
+    def _work(self):
+        timeout = self._interval if self._mode == "periodic" else None
+        while True:
+            with self._cond:
+                if not self._stopping and not self._waiting:
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+            try:
+                self._sync()
+            except Exception as error:  # pylint: disable=broad-except
+                # Any waiting writers have received the error.
+                LOG.warning("Failed to sync collected files: %s", error)
+
+    def _sync(self):
+        with self._cond:
+            paths = self._dirty
+            waiting = self._waiting
+            self._dirty = set()
+            self._waiting = []
+
+        if not paths and not waiting:
+            return
+
+        try:
+            # Files before directories, so that a synced directory entry
+            # never refers to a file whose content isn't yet durable.
+            for path in sorted(paths, key=os.path.isdir):
+                sync_path(path)
+        except Exception as error:
+            # Remains dirty, so sync is attempted again later.
+            with self._cond:
+                self._dirty.update(paths)
+            for future in waiting:
+                future.set_exception(error)
+            raise
+
+        for future in waiting:
+            future.set_result(None)
@@ -0,0 +1,37 @@
+import logging
+
+LOG = logging.getLogger("pushcollector")
+
+BACKENDS_GROUP = "pushcollector.backends"
+
+
+def entry_points(group):
+    # Returns all entry points in the given group.
+    try:
+        from importlib import metadata  # pylint: disable=import-outside-toplevel
+    except ImportError:  # pragma: no cover
+        # Python < 3.8
+        import importlib_metadata as metadata  # pylint: disable=import-outside-toplevel
+
+    all_entry_points = metadata.entry_points()
+    if hasattr(all_entry_points, "select"):
+        return list(all_entry_points.select(group=group))
+    # Python < 3.10: a dict keyed by group
+    return list(all_entry_points.get(group, []))
+
+
+def backend_entry_points():
+    # Returns a dict of backend name => entry point for backends provided by
+    # installed distributions. Entry points are only listed here; no backend
+    # module is imported until its entry point is loaded.
+    out = {}
+    for entry_point in entry_points(BACKENDS_GROUP):
+        if entry_point.name in out:
+            LOG.warning(
+                "Ignoring duplicate pushcollector backend '%s' from %s",
+                entry_point.name,
+                entry_point.value,
+            )
+            continue
+        out[entry_point.name] = entry_point
+    return out
@@ -1,48 +1,369 @@
 import os
 import datetime
+import io
 import json
 import logging
+import tarfile
+import threading
+import time
+
+from .binary import BinaryWriter
+from .durability import Syncer
 
 LOG = logging.getLogger("pushcollector")
 
+PUSHITEMS_BASENAME = {"jsonl": "pushitems.jsonl", "binary": "pushitems.bin"}
+
+BUNDLE_COMPRESSION = {
+    "none": ("", ""),
+    "gz": ("gz", ".gz"),
+    "bz2": ("bz2", ".bz2"),
+    "xz": ("xz", ".xz"),
+}
+
 
 class LocalCollector(object):
-    # Registered as 'local' backend, this collector writes data to files under
-    # the 'artifacts' subdir of the current working directory.
-    # There is no way to customize the used directory.
-    def __init__(self):
+    """A collector backend writing data to files under the ``artifacts``
+    subdirectory of the current working directory.
+
+    This backend is registered as "local". It may be re-registered with
+    non-default arguments, e.g.:
+
+    .. code-block:: python
+
+        Collector.register_backend(
+            "local", lambda: LocalCollector(bundle="gz")
+        )
+
+    Parameters:
+        bundle (str)
+            If provided, every file written by this collector is also streamed
+            into a tar archive created next to the timestamped artifacts
+            directory, i.e. ``artifacts/<timestamp>.tar[.<ext>]``.
+
+            The value selects the compression used for the archive and must be
+            one of "none", "gz", "bz2" or "xz".
+
+            The archive is finalized when the collector is exited as a context
+            manager. Files which may change during the collector's lifetime
+            (the push items file and any files written via ``append_file``)
+            are added to the archive with their final content at that time.
+            Each file appears in the archive only once; if a file already
+            streamed into the archive is written again, the archive is
+            rewritten on exit with the final content of every file.
+
+            An archive can only be written by a single collector; bundling
+            fails if another collector already created the archive.
+
+        pushitems_format (str)
+            Format used to record push items:
+
+            "jsonl" (default)
+                Push items are written to ``pushitems.jsonl`` in JSON Lines
+                format.
+
+            "binary"
+                Push items are written to ``pushitems.bin`` in a compact
+                binary format, which is smaller and much faster to read back.
+                Use :func:`~pushcollector.read_push_items` to read these files,
+                and :func:`~pushcollector.binary_to_jsonl` to convert them
+                to JSON Lines format.
+
+                Unlike JSON Lines files, a binary file can only be written by
+                a single collector; recording push items fails if another
+                collector already created the file.
+
+        durability (str)
+            Controls when written data is flushed to stable storage (fsync):
+
+            "none" (default)
+                Data is never explicitly flushed.
+
+            "exit"
+                All written files are flushed when the collector is exited
+                as a context manager.
+
+            "periodic"
+                Written files are flushed every ``fsync_interval`` seconds,
+                and on exit.
+
+            "group"
+                Futures returned by the collector are only resolved once
+                the written data has been flushed. Concurrent writes are
+                flushed together, so writers share the cost of each flush.
+
+        fsync_interval (float)
+            Interval in seconds between flushes, for "periodic" durability.
+
+    .. versionadded:: 1.4.0
+    """
+
+    def __init__(
+        self,
+        bundle=None,
+        pushitems_format="jsonl",
+        durability="none",
+        fsync_interval=1.0,
+    ):
+        if bundle is not None and bundle not in BUNDLE_COMPRESSION:
+            raise ValueError("Unsupported bundle compression: %s" % repr(bundle))
+        if pushitems_format not in PUSHITEMS_BASENAME:
+            raise ValueError(
+                "Unsupported push items format: %s" % repr(pushitems_format)
+            )
+
         self._artifacts_dir = os.path.join(os.getcwd(), "artifacts", self.timestamp())
+        self._bundle_mode = bundle
+        self._bundle = None
+        self._bundle_file = None
+        self._bundle_created = False
+        self._bundle_closed = False
+        self._pushitems_basename = PUSHITEMS_BASENAME[pushitems_format]
+        # Used as an ordered set of files to be bundled on exit
+        self._bundle_deferred = {self._pushitems_basename: None}
+        # Ordered set of files already streamed into the bundle, and whether
+        # any of them has changed since being streamed
+        self._bundle_streamed = {}
+        self._bundle_stale = False
+        self._binary_writer = BinaryWriter() if pushitems_format == "binary" else None
+        self._binary_created = False
+
+        # Writes of whole records are committed by a single append to a file
+        # opened with O_APPEND, which the OS applies atomically, so ordinary
+        # writes don't need to be serialized. This lock only guards the
+        # first use of each file, and state shared between writers (binary
+        # string dictionary, bundle).
+        self._lock = threading.Lock()
+        self._known_files = set()
+
+        self._syncer = Syncer(durability, fsync_interval)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._close_bundle()
+        finally:
+            self._syncer.close()
 
     def update_push_items(self, items):
-        with self._open_file("pushitems.jsonl", "a") as file:
-            for item in items:
-                json.dump(item, file, sort_keys=True)
-                file.write("\n")
+        if self._binary_writer:
+            return self._update_push_items_binary(items)
+
+        # Each call serializes its records into its own buffer, so that
+        # threads don't contend until the buffer is committed.
+        content = "".join(json.dumps(item, sort_keys=True) + "\n" for item in items)
+        return self._append(self._pushitems_basename, content.encode("utf-8"))
+
+    def _update_push_items_binary(self, items):
+        # Strings must be defined in the file before they're used, so
+        # encoding and writing happen together.
+        path = self._prepare_file(self._pushitems_basename)
+        with self._lock:
+            if not self._binary_created:
+                self._create_exclusive(path)
+                self._binary_created = True
+            self._binary_writer.write(
+                lambda content: self._append_path(path, content), items
+            )
+        return self._syncer.written(path)
+
+    @classmethod
+    def _create_exclusive(cls, path):
+        # The string dictionary of a binary file belongs to a single writer,
+        # so the file must not already have been created by another
+        # collector (e.g. one started in the same second).
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        except FileExistsError:
+            raise RuntimeError(
+                "%s was created by another collector; binary push items files "
+                "can't be shared between collectors" % path
+            )
 
     def attach_file(self, filename, content):
-        with self._open_file(filename, "wb") as file:
+        # Written to a temporary file first, so concurrent writers of the
+        # same file (or readers) never observe partial content.
+        path = self._prepare_file(filename)
+        temp_path = "%s.%s-%s.tmp" % (path, os.getpid(), threading.get_ident())
+        with open(temp_path, "wb") as file:
             file.write(content)
+        os.replace(temp_path, path)
+        self._bundle_attach(filename, content)
+        return self._syncer.written(path, self._artifacts_dir)
 
     def append_file(self, filename, content):
-        with self._open_file(filename, "ab") as file:
-            file.write(content)
+        self._bundle_defer(filename)
+        return self._append(filename, content)
 
-    def _open_file(self, basename, *args, **kwargs):
-        if not os.path.exists(self._artifacts_dir):
-            os.makedirs(self._artifacts_dir)
-            parent_dir = os.path.dirname(self._artifacts_dir)
-            latest_link = os.path.join(parent_dir, "latest")
-            if os.path.exists(latest_link):
-                os.remove(latest_link)
-            os.symlink(os.path.basename(self._artifacts_dir), latest_link)
+    def _append(self, basename, content):
+        path = self._prepare_file(basename)
+        self._append_path(path, content)
+        return self._syncer.written(path)
+
+    @classmethod
+    def _append_path(cls, path, content):
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            view = memoryview(content)
+            while view:
+                # A short write only happens on error conditions such as a
+                # full disk; the rest of the content is still attempted.
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
 
+    def _prepare_file(self, basename):
         path = os.path.join(self._artifacts_dir, basename)
+        if basename in self._known_files:
+            return path
+
+        with self._lock:
+            if basename not in self._known_files:
+                self._make_artifacts_dir()
+
+                # Log the first time we're creating each file
+                if not os.path.exists(path):
+                    LOG.info("Logging to %s", path)
+                    self._syncer.dirty(self._artifacts_dir)
+
+                self._known_files.add(basename)
+
+        return path
+
+    def _make_artifacts_dir(self):
+        try:
+            os.makedirs(self._artifacts_dir)
+        except FileExistsError:
+            return
+
+        # Replace the symlink atomically, so that 'latest' always exists
+        # once it's been created, even if other processes are also updating it.
+        parent_dir = os.path.dirname(self._artifacts_dir)
+        latest_link = os.path.join(parent_dir, "latest")
+        temp_link = "%s.%s-%s.tmp" % (latest_link, os.getpid(), threading.get_ident())
+        os.symlink(os.path.basename(self._artifacts_dir), temp_link)
+        os.replace(temp_link, latest_link)
+        self._syncer.dirty(parent_dir)
+
+    @property
+    def _bundle_path(self):
+        ext = BUNDLE_COMPRESSION[self._bundle_mode][1]
+        return self._artifacts_dir + ".tar" + ext
+
+    def _bundle_attach(self, basename, content):
+        if self._bundle_mode is None:
+            return
+
+        with self._lock:
+            # Files written more than once are only added on exit, with
+            # their final content.
+            if basename in self._bundle_deferred or basename in self._bundle_streamed:
+                self._bundle_defer_locked(basename)
+                return
+            self._bundle_streamed[basename] = None
+            self._bundle_add_locked(basename, content)
+
+    def _bundle_defer(self, basename):
+        if self._bundle_mode is None:
+            return
+
+        with self._lock:
+            self._bundle_defer_locked(basename)
+
+    def _bundle_defer_locked(self, basename):
+        # Must be called with lock held.
+        self._bundle_deferred.setdefault(basename)
+        if basename in self._bundle_streamed:
+            # The streamed content is outdated; the bundle is rewritten on
+            # exit so that each file appears only once.
+            self._bundle_stale = True
+
+    def _bundle_add(self, basename, content):
+        with self._lock:
+            self._bundle_add_locked(basename, content)
+
+    def _bundle_add_locked(self, basename, content):
+        # Must be called with lock held.
+        if self._bundle_closed:
+            return
+
+        if self._bundle is None:
+            # Streaming mode: members are written out sequentially and
+            # never read back, so the archive costs no extra read pass.
+            compression = BUNDLE_COMPRESSION[self._bundle_mode][0]
+            self._bundle_file = self._open_bundle_file()
+            self._bundle = tarfile.open(
+                fileobj=self._bundle_file, mode="w|" + compression
+            )
+            LOG.info("Bundling artifacts to %s", self._bundle_path)
+
+        # Members are nested under the timestamp so that extracting the
+        # bundle reproduces the artifacts directory.
+        info = tarfile.TarInfo(
+            os.path.join(os.path.basename(self._artifacts_dir), basename)
+        )
+        info.size = len(content)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self._bundle.addfile(info, io.BytesIO(content))
+
+    def _open_bundle_file(self):
+        # Must be called with lock held. Like binary push items, the bundle
+        # belongs to a single collector, so it must not already have been
+        # created by another collector (e.g. one started in the same second).
+        # Only a bundle created by this collector may be rewritten.
+        flags = os.O_WRONLY | os.O_CREAT
+        flags |= os.O_TRUNC if self._bundle_created else os.O_EXCL
+        try:
+            fd = os.open(self._bundle_path, flags, 0o666)
+        except FileExistsError:
+            raise RuntimeError(
+                "%s was created by another collector; bundles can't be shared "
+                "between collectors" % self._bundle_path
+            )
+        self._bundle_created = True
+        return os.fdopen(fd, "wb")
+
+    def _finish_bundle_locked(self):
+        # Must be called with lock held.
+        try:
+            self._bundle.close()
+        finally:
+            # tarfile doesn't close file objects it was given.
+            self._bundle_file.close()
+            self._bundle = None
+            self._bundle_file = None
+
+    def _close_bundle(self):
+        if self._bundle_mode is None or self._bundle_closed:
+            return
+
+        with self._lock:
+            if self._bundle_stale:
+                # Rewritten from scratch, with every file's final content.
+                LOG.info("Rewriting %s with updated files", self._bundle_path)
+                if self._bundle:
+                    self._finish_bundle_locked()
+                for basename in self._bundle_streamed:
+                    self._bundle_deferred.setdefault(basename)
 
-        # Log the first time we're creating each file
-        if not os.path.exists(path):
-            LOG.info("Logging to %s", path)
+        # Mutable files are only added once, with their final content.
+        for basename in list(self._bundle_deferred):
+            path = os.path.join(self._artifacts_dir, basename)
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    self._bundle_add(basename, file.read())
 
-        return open(path, *args, **kwargs)
+        with self._lock:
+            if self._bundle:
+                self._finish_bundle_locked()
+                self._syncer.dirty(
+                    self._bundle_path, os.path.dirname(self._artifacts_dir)
+                )
+            self._bundle_closed = True
 
     @classmethod
     def timestamp(cls):
@@ -0,0 +1,453 @@
+import argparse
+import collections
+import filecmp
+import fnmatch
+import heapq
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+
+from more_executors import Executors
+
+from .binary import BinaryWriter, read_push_items
+from .local import PUSHITEMS_BASENAME
+from .sqlite import DB_BASENAME
+from .summary import PushItemSummary
+
+LOG = logging.getLogger("pushcollector")
+
+SUMMARY_BASENAME = "summary.json"
+
+# Files which are regenerated rather than copied.
+MERGED_BASENAMES = frozenset(list(PUSHITEMS_BASENAME.values()) + [SUMMARY_BASENAME])
+
+# Number of push items passed at once from a reader thread to the merge.
+BATCH_SIZE = 1000
+
+# Number of batches a reader thread may read ahead of the merge.
+READ_AHEAD = 2
+
+
+class InputReader(object):
+    # Reads push items from a single input directory in a background thread,
+    # so that reading and decoding of all inputs proceeds in parallel with
+    # the merge. At most READ_AHEAD batches are buffered per input.
+    def __init__(self, index, path, order_by):
+        self._index = index
+        self._path = path
+        self._order_by = order_by
+        self._queue = queue.Queue(READ_AHEAD)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            name="pushcollector-merge-%s" % index, target=self._read, daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _put(self, value):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(value, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _read(self):
+        try:
+            batch = []
+            for item in self._items():
+                batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    self._put(batch)
+                    batch = []
+            self._put(batch)
+            self._put(None)
+        except Exception as error:  # pylint: disable=broad-except
+            self._put(error)
+
+    def _items(self):
+        basenames = [
+            basename
+            for basename in PUSHITEMS_BASENAME.values()
+            if os.path.exists(os.path.join(self._path, basename))
+        ]
+
+        if not basenames:
+            LOG.warning("No push items in %s", self._path)
+            return
+
+        if len(basenames) > 1:
+            # The order of updates between the two files is unknown.
+            raise ValueError(
+                "Can't merge %s: it has push items in both %s"
+                % (self._path, " and ".join(basenames))
+            )
+
+        path = os.path.join(self._path, basenames[0])
+
+        # Each input keeps the order in which its items were recorded; the
+        # sort key is the highest order_by value seen so far in the input,
+        # so that each stream is sorted as required by the merge even if
+        # values were recorded slightly out of order.
+        watermark = None
+        for (position, item) in enumerate(read_push_items(path)):
+            if self._order_by:
+                value = item.get(self._order_by)
+                if value is None:
+                    raise ValueError(
+                        "Push item %s in %s has no '%s'"
+                        % (item["filename"], path, self._order_by)
+                    )
+                kind = order_kind(value)
+                if kind is None:
+                    raise ValueError(
+                        "Push item %s in %s has '%s' of type %s; it must be a "
+                        "number or a string"
+                        % (item["filename"], path, self._order_by, type(value).__name__)
+                    )
+                expected = kind if watermark is None else order_kind(watermark)
+                if kind != expected:
+                    raise ValueError(
+                        "Push item %s in %s has a %s '%s', but earlier push "
+                        "items have a %s"
+                        % (item["filename"], path, kind, self._order_by, expected)
+                    )
+                if watermark is None or value > watermark:
+                    watermark = value
+            yield (watermark, self._index, position, item)
+
+    def __iter__(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            for entry in batch:
+                yield entry
+
+
+def order_kind(value):
+    # Values of order_by must be comparable across all push items, so
+    # they're restricted to a single kind.
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return None
+
+
+def is_sqlite_file(basename):
+    # Whether a file or directory at the top of an artifacts directory belongs
+    # to a database written by the "sqlite" backend. Such databases can't be
+    # merged.
+    return basename in [
+        DB_BASENAME + suffix for suffix in ("", "-wal", "-shm", "-journal", ".files")
+    ]
+
+
+def list_files(path):
+    # Returns paths relative to an input directory of all files to be
+    # copied into the output.
+    out = []
+    for (dirpath, dirnames, filenames) in os.walk(path):
+        if dirpath == path:
+            for name in sorted(dirnames + filenames):
+                if is_sqlite_file(name):
+                    LOG.warning(
+                        "Skipping %s in %s: SQLite databases can't be merged",
+                        name,
+                        path,
+                    )
+            dirnames[:] = [name for name in dirnames if not is_sqlite_file(name)]
+            filenames = [
+                name
+                for name in filenames
+                if not is_sqlite_file(name) and name not in MERGED_BASENAMES
+            ]
+        dirnames.sort()
+        for filename in sorted(filenames):
+            out.append(os.path.relpath(os.path.join(dirpath, filename), path))
+    return out
+
+
+def concat_files(sources, dest):
+    parent_dir = os.path.dirname(dest)
+    if not os.path.exists(parent_dir):
+        os.makedirs(parent_dir)
+    with open(dest, "wb") as out:
+        for source in sources:
+            with open(source, "rb") as file:
+                shutil.copyfileobj(file, out)
+
+
+def copy_latest(sources, dest):
+    # Copies the last of several versions of a file which isn't appended to,
+    # warning if the versions differ.
+    latest = sources[-1]
+    if any(not filecmp.cmp(source, latest, shallow=False) for source in sources[:-1]):
+        LOG.warning("Using %s, which differs from other inputs", latest)
+    concat_files([latest], dest)
+
+
+def is_appended(relpath, append_files):
+    return any(fnmatch.fnmatchcase(relpath, pattern) for pattern in append_files)
+
+
+def write_push_items(items, path, pushitems_format):
+    writer = BinaryWriter() if pushitems_format == "binary" else None
+    with open(path, "wb") as file:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= BATCH_SIZE:
+                file.write(encode_items(batch, writer))
+                batch = []
+        file.write(encode_items(batch, writer))
+
+
+def encode_items(items, writer):
+    if writer:
+        return writer.encode(items)
+    content = "".join(json.dumps(item, sort_keys=True) + "\n" for item in items)
+    return content.encode("utf-8")
+
+
+def merge_artifacts(
+    inputs,
+    output,
+    order_by=None,
+    workers=4,
+    pushitems_format="jsonl",
+    append_files=None,
+):
+    """Merge artifacts directories written by the "local" backend.
+
+    This may be used to combine the artifacts of a push which was
+    spread over multiple hosts or processes, each writing its own
+    ``artifacts/<timestamp>`` directory. The output directory
+    contains:
+
+    * push items from all inputs, with only the latest state of each
+      push item (as identified by "filename" and "dest"), in the order in
+      which push items reached their latest state
+    * ``summary.json``, summarizing the merged push items
+    * every other file from the inputs. If a file of the same name exists
+      in several inputs:
+
+      * if it matches ``append_files``, the files are concatenated in the
+        order of ``inputs``
+      * otherwise, the file from the last of those inputs is used, and a
+        warning is logged if the files differ
+
+    Databases written by the "sqlite" backend into an artifacts directory
+    can't be merged, and are skipped with a warning.
+
+    Push items are streamed from all inputs at once and merged, so memory
+    use depends on the number of distinct push items rather than the size
+    of the inputs.
+
+    This function is also available as the ``pushcollector-merge`` command.
+
+    Parameters:
+        inputs (list[str])
+            Paths to the artifacts directories to be merged.
+
+        output (str)
+            Path to the directory to which merged artifacts are written.
+            It's created if it doesn't exist.
+
+        order_by (str)
+            Name of a push item field holding a sequence number or timestamp,
+            used to order push items from different inputs. Within each
+            input, push items keep the order in which they were recorded.
+
+            pushcollector doesn't record such a field itself, so it must be
+            added to push items by the caller, e.g. as a timestamp set on
+            each update. Every push item must have the field, and its values
+            must be either all numbers or all strings (such as ISO 8601
+            timestamps in UTC); otherwise, :class:`ValueError` is raised.
+
+            If omitted, push items from later inputs are ordered after those
+            of earlier inputs.
+
+        workers (int)
+            Maximum number of files concatenated concurrently.
+
+        pushitems_format (str)
+            Format of the merged push items file, "jsonl" or "binary",
+            as in :class:`~pushcollector.LocalCollector`.
+
+        append_files (list[str])
+            Glob patterns, as in :mod:`fnmatch`, matching the paths (relative
+            to each input) of files written via
+            :meth:`~pushcollector.Collector.append_file`, e.g. ``["*.log"]``.
+            The contents of such files are concatenated across inputs.
+
+    Returns:
+        dict
+            A summary of the merged push items, as returned by
+            :meth:`~pushcollector.Collector.summary`.
+
+    .. versionadded:: 1.4.0
+    """
+    if pushitems_format not in PUSHITEMS_BASENAME:
+        raise ValueError("Unsupported push items format: %s" % repr(pushitems_format))
+
+    if not os.path.exists(output):
+        os.makedirs(output)
+
+    executor = Executors.thread_pool(max_workers=workers, name="pushcollector-merge")
+    with executor:
+        # Other files are copied in the background while push items
+        # are merged.
+        sources = collections.OrderedDict()
+        for listing in executor.map(lambda path: (path, list_files(path)), inputs):
+            (path, relpaths) = listing
+            for relpath in relpaths:
+                sources.setdefault(relpath, []).append(os.path.join(path, relpath))
+
+        copies = []
+        for (relpath, paths) in sources.items():
+            write = (
+                concat_files
+                if is_appended(relpath, append_files or [])
+                else copy_latest
+            )
+            copies.append(executor.submit(write, paths, os.path.join(output, relpath)))
+
+        latest = merge_push_items(inputs, order_by)
+
+        write_push_items(
+            latest.values(),
+            os.path.join(output, PUSHITEMS_BASENAME[pushitems_format]),
+            pushitems_format,
+        )
+
+        summary = PushItemSummary()
+        summary.update(latest.values())
+        result = summary.get()
+        if latest:
+            with open(os.path.join(output, SUMMARY_BASENAME), "w") as file:
+                file.write(json.dumps(result, sort_keys=True, indent=2))
+
+        for copy in copies:
+            copy.result()
+
+    LOG.info(
+        "Merged %s push item(s) and %s file(s) from %s input(s) into %s",
+        len(latest),
+        len(sources),
+        len(inputs),
+        output,
+    )
+    return result
+
+
+def order_key(inputs, order_by):
+    # Returns a key function for merging entries from InputReaders, which
+    # fails clearly if inputs use different kinds of order_by values rather
+    # than raising TypeError from comparisons.
+    first = []
+
+    def key(entry):
+        (watermark, index, position, _) = entry
+        kind = order_kind(watermark)
+        if not first:
+            first.append((kind, index))
+        elif kind != first[0][0]:
+            raise ValueError(
+                "'%s' has %s values in %s, but %s values in %s"
+                % (order_by, kind, inputs[index], first[0][0], inputs[first[0][1]])
+            )
+        return (watermark, index, position)
+
+    return key
+
+
+def merge_push_items(inputs, order_by):
+    # Returns an OrderedDict of (filename, dest) => latest push item, ordered
+    # by when each push item reached its latest state.
+    readers = [
+        InputReader(index, path, order_by) for (index, path) in enumerate(inputs)
+    ]
+    for reader in readers:
+        reader.start()
+
+    latest = collections.OrderedDict()
+    try:
+        streams = readers
+        if order_by:
+            streams = [heapq.merge(*readers, key=order_key(inputs, order_by))]
+        for stream in streams:
+            for (_, _, _, item) in stream:
+                key = (item["filename"], item.get("dest"))
+                latest.pop(key, None)
+                latest[key] = item
+    finally:
+        for reader in readers:
+            reader.stop()
+
+    return latest
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Merge artifacts directories written by the pushcollector "
+        '"local" backend.'
+    )
+    parser.add_argument("inputs", nargs="+", metavar="INPUT", help="input directory")
+    parser.add_argument(
+        "-o", "--output", required=True, help="output directory (created if needed)"
+    )
+    parser.add_argument(
+        "--order-by",
+        metavar="FIELD",
+        help="push item field with a sequence number or timestamp used to "
+        "order push items across inputs; all values must be numbers or all "
+        "strings (default: order of inputs)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="maximum number of files copied concurrently",
+    )
+    parser.add_argument(
+        "--format",
+        dest="pushitems_format",
+        choices=sorted(PUSHITEMS_BASENAME),
+        default="jsonl",
+        help="format of the merged push items file",
+    )
+    parser.add_argument(
+        "--append",
+        dest="append_files",
+        action="append",
+        metavar="PATTERN",
+        help="glob pattern matching files written via append_file, which are "
+        "concatenated across inputs (may be given more than once)",
+    )
+    parsed = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    summary = merge_artifacts(
+        parsed.inputs,
+        parsed.output,
+        order_by=parsed.order_by,
+        workers=parsed.workers,
+        pushitems_format=parsed.pushitems_format,
+        append_files=parsed.append_files,
+    )
+    for (state, count) in sorted(summary["states"].items()):
+        print("%s: %s" % (state, count))
@@ -0,0 +1,480 @@
+import datetime
+import json
+import logging
+import threading
+from concurrent.futures import Future
+
+from more_executors import Executors
+from more_executors.futures import f_flat_map, f_map, f_return, f_sequence
+
+LOG = logging.getLogger("pushcollector")
+
+MiB = 1024 * 1024
+
+
+class ObjectStoreCollector(object):
+    """A collector backend writing data to S3-compatible object storage.
+
+    This backend is not registered by default, as it requires configuration.
+    To use it, register it with the desired arguments, e.g.:
+
+    .. code-block:: python
+
+        Collector.register_backend(
+            "s3", lambda: ObjectStoreCollector(bucket="my-artifacts")
+        )
+
+    Data is stored under the given ``prefix`` as follows:
+
+    * push items are uploaded in batches, as ``pushitems/<seq>.jsonl``
+      objects in `JSON Lines`_ format
+    * files from ``attach_file`` are uploaded as objects of the same name;
+      large files are split into parts which are uploaded in parallel
+    * content from ``append_file`` is buffered and uploaded as temporary
+      part objects. When the collector is exited as a context manager,
+      each file's parts are composed into a single object of the
+      file's name, following any content previously attached to that file.
+      A file is not composed if any of its parts failed to upload. Part
+      objects are deleted on exit, even if composing fails.
+
+    Parameters:
+        bucket (str)
+            Name of the bucket to which data is written.
+
+        prefix (str)
+            Prefix for the keys of all written objects. Defaults to
+            ``artifacts/<timestamp>/``.
+
+        client
+            A boto3 S3 client. If omitted, a client is created using the
+            default boto3 configuration, with a connection pool sized to
+            ``workers`` so connections are reused between uploads.
+
+        part_size (int)
+            Size, in bytes, of parts for multipart uploads. Attached files
+            larger than this are uploaded in parts, and appended content is
+            uploaded as a part whenever this much content is buffered.
+            Must be at least 5 MiB.
+
+        workers (int)
+            Maximum number of concurrent uploads.
+
+        batch_size (int)
+            Maximum number of push items per uploaded batch.
+
+        flush_interval (float)
+            Maximum time, in seconds, for which push items and appended
+            content are buffered before being uploaded.
+
+    .. versionadded:: 1.4.0
+
+    .. _JSON Lines: http://jsonlines.org/
+    """
+
+    # Minimum size of all but the last part of a multipart upload, as
+    # required by S3.
+    MIN_PART_SIZE = 5 * MiB
+
+    # Maximum number of keys per delete_objects request.
+    MAX_DELETE = 1000
+
+    def __init__(
+        self,
+        bucket,
+        prefix=None,
+        client=None,
+        part_size=8 * MiB,
+        workers=8,
+        batch_size=10000,
+        flush_interval=5.0,
+    ):
+        if part_size < self.MIN_PART_SIZE:
+            raise ValueError(
+                "part_size must be at least %s bytes, got: %s"
+                % (self.MIN_PART_SIZE, part_size)
+            )
+
+        self._bucket = bucket
+        self._prefix = prefix
+        if prefix is None:
+            self._prefix = "artifacts/%s/" % self.timestamp()
+        self._client = client or self._default_client(workers)
+        self._part_size = part_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._workers = workers
+        # Created on demand and shut down on exit, so that no threads
+        # outlive the collector's use.
+        self._executor = None
+
+        self._lock = threading.RLock()
+        self._pending = []
+
+        self._item_seq = 0
+        self._items = []
+        self._items_future = None
+
+        # filename => buffered content, and the future for its upload
+        self._append_buffers = {}
+        # filename => list of (key, size, future) for uploaded parts. The
+        # first part may be the file's own object, holding content attached
+        # (or composed) earlier.
+        self._append_parts = {}
+        self._part_seq = 0
+        # filename => size of the object written by attach_file
+        self._attached = {}
+        # Keys of part objects no longer needed, deleted on exit
+        self._stale_keys = []
+
+        self._flusher = None
+        self._stop_flusher = threading.Event()
+
+    @classmethod
+    def _default_client(cls, workers):
+        # Imported here since boto3 is only needed if no client is provided.
+        import boto3  # pylint: disable=import-outside-toplevel
+        from botocore.config import Config  # pylint: disable=import-outside-toplevel
+
+        return boto3.client("s3", config=Config(max_pool_connections=workers))
+
+    @classmethod
+    def timestamp(cls):
+        return datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop_flusher.set()
+        if self._flusher:
+            self._flusher.join()
+            self._flusher = None
+        self._stop_flusher.clear()
+
+        try:
+            self._flush()
+            self._wait_pending()
+
+            # Each file is composed independently, so that one failure
+            # doesn't prevent composing the others.
+            errors = []
+            for filename in sorted(self._append_parts):
+                try:
+                    self._compose(filename)
+                except Exception as error:  # pylint: disable=broad-except
+                    LOG.warning(
+                        "Failed to compose %s%s: %s", self._prefix, filename, error
+                    )
+                    errors.append(error)
+            if errors:
+                raise errors[0]
+        finally:
+            try:
+                self._delete_stale()
+            finally:
+                with self._lock:
+                    executor = self._executor
+                    self._executor = None
+                if executor:
+                    executor.shutdown(wait=True)
+
+    def _delete_stale(self):
+        # Deletes part objects no longer needed, including those of any
+        # file which couldn't be composed.
+        with self._lock:
+            for parts in self._append_parts.values():
+                self._add_stale(parts)
+            self._append_parts = {}
+            stale = [{"Key": key} for key in self._stale_keys]
+            self._stale_keys = []
+        self._delete(stale)
+
+    def _add_stale(self, parts):
+        # Must be called with lock held. Parts other than a file's own
+        # object are deleted on exit.
+        for (part_key, _, _) in parts:
+            if part_key.startswith(self._prefix + ".parts/"):
+                self._stale_keys.append(part_key)
+
+    def update_push_items(self, items):
+        if not items:
+            return f_return()
+
+        with self._lock:
+            self._ensure_flusher()
+            futures = []
+            for item in items:
+                if not self._items:
+                    self._items_future = Future()
+                self._items.append(item)
+                # Items may span several batches
+                if not futures or futures[-1] is not self._items_future:
+                    futures.append(self._items_future)
+                if len(self._items) >= self._batch_size:
+                    self._flush_items()
+
+        return f_sequence(futures)
+
+    def attach_file(self, filename, content):
+        key = self._prefix + filename
+        with self._lock:
+            # Replaces anything appended so far; the attached object becomes
+            # the start of the file if it's appended to later.
+            pending = self._append_buffers.pop(filename, None)
+            if pending:
+                pending[1].set_result(None)
+            self._add_stale(self._append_parts.pop(filename, []))
+            self._attached[filename] = len(content)
+
+        if len(content) <= self._part_size:
+            return self._track(self._submit_put(key, content))
+        return self._track(self._multipart_upload(key, content))
+
+    def append_file(self, filename, content):
+        with self._lock:
+            self._ensure_flusher()
+            if filename not in self._append_buffers:
+                self._append_buffers[filename] = (bytearray(), Future())
+            (buf, future) = self._append_buffers[filename]
+            buf.extend(content)
+            if len(buf) >= self._part_size:
+                self._flush_append(filename)
+        return future
+
+    def _flush(self):
+        # Upload all buffered push items and appended content.
+        with self._lock:
+            self._flush_items()
+            for filename in list(self._append_buffers):
+                self._flush_append(filename)
+
+    def _ensure_flusher(self):
+        # Must be called with lock held.
+        if not self._flusher:
+            self._flusher = threading.Thread(
+                name="pushcollector-objectstore-flush",
+                target=self._flush_periodically,
+                daemon=True,
+            )
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._stop_flusher.wait(self._flush_interval):
+            self._flush()
+
+    def _flush_items(self):
+        # Must be called with lock held.
+        if not self._items:
+            return
+
+        key = "%spushitems/%08d.jsonl" % (self._prefix, self._item_seq)
+        self._item_seq += 1
+        content = "".join(
+            json.dumps(item, sort_keys=True) + "\n" for item in self._items
+        )
+        self._chain(self._submit_put(key, content.encode("utf-8")), self._items_future)
+        self._items = []
+        self._items_future = None
+
+    def _flush_append(self, filename):
+        # Must be called with lock held.
+        (buf, future) = self._append_buffers.pop(filename)
+        key = "%s.parts/%s/%08d" % (self._prefix, filename, self._part_seq)
+        self._part_seq += 1
+        if filename not in self._append_parts:
+            self._append_parts[filename] = []
+            if filename in self._attached:
+                self._append_parts[filename].append(
+                    (self._prefix + filename, self._attached[filename], f_return())
+                )
+        uploaded = self._submit_put(key, bytes(buf))
+        self._append_parts[filename].append((key, len(buf), uploaded))
+        self._chain(uploaded, future)
+
+    def _chain(self, source, target):
+        # Resolve target from source, and track it as pending.
+        def on_done(f):
+            if f.exception():
+                target.set_exception(f.exception())
+            else:
+                target.set_result(None)
+
+        source.add_done_callback(on_done)
+        self._track(target)
+
+    def _track(self, future):
+        with self._lock:
+            self._pending.append(future)
+        return future
+
+    def _wait_pending(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+        for future in pending:
+            future.exception()
+
+    def _submit(self, *args, **kwargs):
+        with self._lock:
+            if not self._executor:
+                self._executor = Executors.thread_pool(
+                    max_workers=self._workers, name="pushcollector-objectstore"
+                )
+            return self._executor.submit(*args, **kwargs)
+
+    def _call(self, method, **kwargs):
+        return getattr(self._client, method)(Bucket=self._bucket, **kwargs)
+
+    def _submit_put(self, key, content):
+        return self._submit(self._call, "put_object", Key=key, Body=content)
+
+    def _multipart_upload(self, key, content):
+        # Parts are uploaded in parallel; the upload is completed once all
+        # parts are uploaded, or aborted if any part fails.
+        created = self._submit(self._call, "create_multipart_upload", Key=key)
+        upload_id = f_map(created, lambda response: response["UploadId"])
+
+        def upload_parts(upload_id):
+            parts = []
+            view = memoryview(content)
+            for (index, offset) in enumerate(range(0, len(content), self._part_size)):
+                parts.append(
+                    f_map(
+                        self._submit(
+                            self._call,
+                            "upload_part",
+                            Key=key,
+                            UploadId=upload_id,
+                            PartNumber=index + 1,
+                            Body=bytes(view[offset : offset + self._part_size]),
+                        ),
+                        lambda response, number=index + 1: {
+                            "ETag": response["ETag"],
+                            "PartNumber": number,
+                        },
+                    )
+                )
+            return self._complete(key, upload_id, f_sequence(parts))
+
+        return f_flat_map(upload_id, upload_parts)
+
+    def _complete(self, key, upload_id, parts):
+        # Completes a multipart upload once all parts are available.
+        def complete(parts):
+            return self._submit(
+                self._call,
+                "complete_multipart_upload",
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+
+        completed = f_flat_map(parts, complete)
+        out = Future()
+
+        def on_done(f):
+            error = f.exception()
+            if not error:
+                out.set_result(f.result())
+                return
+
+            # Resolved only once aborted, so that no incomplete upload
+            # remains by the time the caller sees the error.
+            LOG.warning("Aborting upload of %s: %s", key, error)
+            aborted = self._submit(
+                self._call, "abort_multipart_upload", Key=key, UploadId=upload_id
+            )
+            aborted.add_done_callback(lambda _: out.set_exception(error))
+
+        completed.add_done_callback(on_done)
+        return out
+
+    def _compose(self, filename):
+        # Compose uploaded parts of an appended file into a single object.
+        #
+        # Parts large enough for a multipart upload are copied server-side;
+        # smaller parts (e.g. flushed due to flush_interval) are downloaded
+        # and combined with their neighbours.
+        key = self._prefix + filename
+        with self._lock:
+            parts = self._append_parts.pop(filename)
+            # Parts are deleted on exit whether or not composing succeeds.
+            self._add_stale(parts)
+
+        if any(future.exception() for (_, _, future) in parts):
+            # The error was already reported via append_file's future.
+            LOG.warning("Not composing %s since some parts failed to upload", key)
+            return
+
+        LOG.info("Composing %s from %s part(s)", key, len(parts))
+        if len(parts) == 1:
+            if parts[0][0] != key:
+                self._call("copy_object", Key=key, CopySource=self._source(parts[0][0]))
+        else:
+            self._compose_multipart(key, parts)
+
+        # The composed object serves as the first part if the file is
+        # appended to again.
+        self._attached[filename] = sum(size for (_, size, _) in parts)
+
+    def _delete(self, objects):
+        for i in range(0, len(objects), self.MAX_DELETE):
+            self._call(
+                "delete_objects", Delete={"Objects": objects[i : i + self.MAX_DELETE]}
+            )
+
+    def _compose_multipart(self, key, parts):
+        upload_id = self._call("create_multipart_upload", Key=key)["UploadId"]
+        futures = []
+        try:
+            self._add_parts(key, upload_id, parts, futures)
+        except Exception as error:
+            # Parts already submitted are waited for, so that none are
+            # added to the upload after it's aborted.
+            for future in futures:
+                future.exception()
+            LOG.warning("Aborting upload of %s: %s", key, error)
+            self._call("abort_multipart_upload", Key=key, UploadId=upload_id)
+            raise
+
+        # Aborted by _complete if any part fails.
+        self._complete(key, upload_id, f_sequence(futures)).result()
+
+    def _add_parts(self, key, upload_id, parts, futures):
+        # Submits uploads of the parts of a multipart upload composing key,
+        # appending a future for each to futures.
+        def add_part(method, **kwargs):
+            number = len(futures) + 1
+            futures.append(
+                f_map(
+                    self._submit(
+                        self._call,
+                        method,
+                        Key=key,
+                        UploadId=upload_id,
+                        PartNumber=number,
+                        **kwargs
+                    ),
+                    lambda response: {
+                        "ETag": (response.get("CopyPartResult") or response)["ETag"],
+                        "PartNumber": number,
+                    },
+                )
+            )
+
+        buf = bytearray()
+        for (part_key, size, _) in parts:
+            if not buf and size >= self.MIN_PART_SIZE:
+                add_part("upload_part_copy", CopySource=self._source(part_key))
+                continue
+
+            buf.extend(self._call("get_object", Key=part_key)["Body"].read())
+            if len(buf) >= self.MIN_PART_SIZE:
+                add_part("upload_part", Body=bytes(buf))
+                buf = bytearray()
+
+        if buf or not futures:
+            add_part("upload_part", Body=bytes(buf))
+
+    def _source(self, key):
+        return {"Bucket": self._bucket, "Key": key}
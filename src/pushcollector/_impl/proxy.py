@@ -1,9 +1,17 @@
-import os
+import json
+import logging
+import threading
+from concurrent.futures import Future
 
-from more_executors.futures import f_return, f_map
-import yaml
+from more_executors.futures import f_return, f_map, f_flat_map, f_sequence
 import jsonschema
 
+from .schema import read_schema, FastItemCheck
+from .summary import PushItemSummary
+from .trace import NullTracer
+
+LOG = logging.getLogger("pushcollector")
+
 
 def empty_future(value):
     if "add_done_callback" in dir(value):
@@ -22,13 +30,6 @@ def maybe_encode(value):
     return value
 
 
-def read_schema(filename):
-    thisdir = os.path.dirname(__file__)
-    path = os.path.join(thisdir, "schema", filename)
-    with open(path) as schema_file:
-        return yaml.safe_load(schema_file)
-
-
 class CollectorProxy(object):
     # A proxy used to wrap any collector backend before providing to
     # the caller, i.e. this library does not return backend implementations
@@ -46,17 +47,58 @@ class CollectorProxy(object):
     #
     _ITEM_SCHEMA = read_schema("pushitem.yaml")
 
-    def __init__(self, delegate):
+    # Built once, since validating via jsonschema.validate checks the schema
+    # itself on every call, costing far more than validating the item.
+    _ITEM_VALIDATOR = jsonschema.validators.validator_for(_ITEM_SCHEMA)(_ITEM_SCHEMA)
+    _ITEM_CHECK = FastItemCheck(_ITEM_SCHEMA)
+
+    def __init__(self, delegate, tracer=None, scheduler=None, checksum_cache=None):
         self._delegate = delegate
+        self._scheduler = scheduler
+        self._checksum_cache = checksum_cache
+        # With a checksum cache, push items are submitted once enriched;
+        # this future is resolved once the most recent call was submitted,
+        # so that calls reach the backend in order.
+        self._enrich_lock = threading.Lock()
+        self._last_submitted = f_return()
+        self._tracer = tracer or NullTracer()
+        self._summary = PushItemSummary()
 
     def __enter__(self):
         if hasattr(self._delegate, "__enter__"):
             self._delegate.__enter__()
         return self
 
-    def __exit__(self, *args):
-        if hasattr(self._delegate, "__exit__"):
-            self._delegate.__exit__(*args)
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # The backend is always exited, so that it can release resources
+        # even if writing the summary fails.
+        try:
+            self._last_submitted.result()
+            self._write_summary(exc_type)
+            if self._scheduler:
+                self._scheduler.join()
+        finally:
+            try:
+                if hasattr(self._delegate, "__exit__"):
+                    self._delegate.__exit__(exc_type, exc_val, exc_tb)
+            finally:
+                self._tracer.write()
+
+    def _write_summary(self, exc_type):
+        # Written through the backend before it's exited, so that the
+        # summary is collected alongside the push items. Backends needn't
+        # support attach_file, in which case no summary is written.
+        if not self._summary or not hasattr(self._delegate, "attach_file"):
+            return
+
+        content = json.dumps(self.summary(), sort_keys=True, indent=2)
+        try:
+            self.attach_file("summary.json", content).result()
+        except Exception:
+            if exc_type is None:
+                raise
+            # Don't hide the error which caused the exit.
+            LOG.warning("Failed to attach summary.json", exc_info=True)
 
     def _translate_pushitem(self, pushitem):
         if isinstance(pushitem, dict):
@@ -92,19 +134,74 @@ class CollectorProxy(object):
         return pushitems or [push_item]
 
     def update_push_items(self, items):
-        pushitems = []
-        for item in items:
-            item_dicts = self._translate_pushitem(item)
-            for item_dict in item_dicts:
-                jsonschema.validate(item_dict, schema=self._ITEM_SCHEMA)
-            pushitems.extend(item_dicts)
-
-        return empty_future(self._delegate.update_push_items(pushitems))
+        tracer = self._tracer
+        with tracer.span("update_push_items") as span:
+            pushitems = []
+            with tracer.span("translate"):
+                for item in items:
+                    pushitems.extend(self._translate_pushitem(item))
+
+            with tracer.span("validate"):
+                for item_dict in pushitems:
+                    if not self._ITEM_CHECK(item_dict):
+                        self._ITEM_VALIDATOR.validate(item_dict)
+
+            span["items"] = len(pushitems)
+            with tracer.span("submit"):
+                if self._checksum_cache:
+                    result = self._submit_enriched(pushitems)
+                else:
+                    result = empty_future(self._submit("update_push_items", pushitems))
+
+            with tracer.span("summarize"):
+                self._summary.update(pushitems)
+
+        return tracer.track_future("update_push_items", result, items=len(pushitems))
+
+    def _submit_enriched(self, pushitems):
+        # Submits pushitems once checksums are filled in, without blocking
+        # the caller while files are hashed.
+        enriched = self._checksum_cache.enrich(pushitems)
+
+        def submit(results):
+            return empty_future(self._submit("update_push_items", results[1]))
+
+        with self._enrich_lock:
+            ready = f_sequence([self._last_submitted, enriched])
+            # Resolved with the backend's future once submitted
+            submitted = f_map(ready, submit)
+
+            # The next call waits for this one to be submitted, whether
+            # or not it succeeds.
+            last_submitted = Future()
+            submitted.add_done_callback(lambda _: last_submitted.set_result(None))
+            self._last_submitted = last_submitted
+
+        return f_flat_map(submitted, lambda result: result)
+
+    def summary(self):
+        return self._summary.get()
 
     def attach_file(self, filename, content):
-        content = maybe_encode(content)
-        return empty_future(self._delegate.attach_file(filename, content))
+        return self._write_file("attach_file", filename, content)
 
     def append_file(self, filename, content):
-        content = maybe_encode(content)
-        return empty_future(self._delegate.append_file(filename, content))
+        return self._write_file("append_file", filename, content)
+
+    def _write_file(self, method, filename, content):
+        tracer = self._tracer
+        with tracer.span(method, filename=filename) as span:
+            with tracer.span("translate"):
+                content = maybe_encode(content)
+
+            span["bytes"] = len(content)
+            with tracer.span("submit"):
+                result = empty_future(self._submit(method, filename, content))
+
+        return tracer.track_future(method, result, bytes=len(content))
+
+    def _submit(self, method, *args):
+        fn = getattr(self._delegate, method)
+        if self._scheduler:
+            return self._scheduler.submit(method, fn, *args)
+        return fn(*args)
@@ -0,0 +1,245 @@
+import collections
+import threading
+from concurrent.futures import Future
+
+# Lanes in order of priority.
+LANES = ("update_push_items", "append_file", "attach_file")
+
+# Lanes for calls writing to a file, named by the first argument.
+FILE_LANES = ("append_file", "attach_file")
+
+
+class PriorityScheduler(object):
+    """Schedules calls to a collector backend in priority order.
+
+    Calls are placed into a lane per collector method. Whenever a worker is
+    available, it runs the next call from the highest priority lane with
+    any waiting calls, in this order:
+
+    1. ``update_push_items`` - small, latency-sensitive updates
+    2. ``append_file``
+    3. ``attach_file`` - potentially large bulk writes
+
+    To ensure lower priority calls are not starved, a lane which has been
+    passed over ``fairness`` times in a row is served next.
+
+    Calls writing to the same file are always run one at a time, in the
+    order they were made, regardless of their lanes. For example, an
+    ``attach_file`` followed by an ``append_file`` of the same file
+    always results in the attached content followed by the appended
+    content.
+
+    A scheduler may be passed to :meth:`~pushcollector.Collector.get`, in which
+    case calls on the returned collector return immediately after scheduling
+    the call, with the returned future resolved once the backend has
+    completed the call.
+
+    Parameters:
+        workers (int)
+            Maximum number of threads used to invoke the backend.
+
+        limits (dict)
+            Maximum number of concurrently running calls per lane, keyed by
+            method name.
+
+            By default, ``update_push_items`` and ``append_file`` calls are run
+            one at a time, which ensures they're passed to the backend in the
+            same order as they were made. ``attach_file`` calls may use
+            all workers.
+
+        fairness (int)
+            Maximum number of times a lane with waiting calls may be passed
+            over in favor of higher priority lanes.
+
+    .. versionadded:: 1.4.0
+    """
+
+    def __init__(self, workers=4, limits=None, fairness=8):
+        self._workers = workers
+        self._fairness = fairness
+        self._limits = {
+            "update_push_items": 1,
+            "append_file": 1,
+            "attach_file": workers,
+        }
+        self._limits.update(limits or {})
+
+        self._cond = threading.Condition()
+        self._queues = dict((lane, collections.deque()) for lane in LANES)
+        self._running = dict((lane, 0) for lane in LANES)
+        self._passed = dict((lane, 0) for lane in LANES)
+        self._completed = dict((lane, 0) for lane in LANES)
+        self._max_queued = dict((lane, 0) for lane in LANES)
+        # filename => deque of sequence numbers of its queued or running
+        # calls; only the call at the head may run.
+        self._file_calls = {}
+        self._seq = 0
+        self._threads = []
+        self._shutdown = False
+
+    def submit(self, lane, fn, *args):
+        # Schedule fn(*args) in the given lane. If fn returns a future, the
+        # call occupies its lane until that future is resolved.
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new calls after shutdown")
+
+            filename = args[0] if lane in FILE_LANES else None
+            seq = self._seq
+            self._seq += 1
+            if filename is not None:
+                self._file_calls.setdefault(filename, collections.deque()).append(seq)
+
+            queue = self._queues[lane]
+            queue.append((fn, args, future, filename, seq))
+            self._max_queued[lane] = max(self._max_queued[lane], len(queue))
+
+            if len(self._threads) < self._workers:
+                thread = threading.Thread(
+                    name="pushcollector-scheduler-%s" % len(self._threads),
+                    target=self._work,
+                    daemon=True,
+                )
+                self._threads.append(thread)
+                thread.start()
+
+            self._cond.notify()
+        return future
+
+    def stats(self):
+        """Get statistics for each lane.
+
+        Returns:
+            dict
+                A dict keyed by lane (method name). Each value is a dict with
+                keys "queued" (number of calls currently waiting), "running"
+                (number of calls currently running), "completed" (number of
+                calls completed) and "max_queued" (largest number of calls
+                which were ever waiting at once).
+        """
+        with self._cond:
+            return dict(
+                (
+                    lane,
+                    {
+                        "queued": len(self._queues[lane]),
+                        "running": self._running[lane],
+                        "completed": self._completed[lane],
+                        "max_queued": self._max_queued[lane],
+                    },
+                )
+                for lane in LANES
+            )
+
+    def join(self):
+        """Block until all scheduled calls have completed."""
+        with self._cond:
+            while self._busy():
+                self._cond.wait()
+
+    def shutdown(self):
+        """Complete all scheduled calls, then stop all worker threads.
+
+        No further calls may be scheduled after shutdown.
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _busy(self):
+        return any(self._queues.values()) or any(self._running.values())
+
+    def _ready_index(self, lane):
+        # Must be called with lock held. Returns the index of the first call
+        # in the lane which may run now, or None. A call on a file may only
+        # run once all earlier calls on that file have completed.
+        for (index, entry) in enumerate(self._queues[lane]):
+            filename = entry[3]
+            if filename is None or self._file_calls[filename][0] == entry[4]:
+                return index
+        return None
+
+    def _next_call(self):
+        # Must be called with lock held. Returns (lane, entry) for the next
+        # call to run, removed from its queue, or None.
+        ready = {}
+        for lane in LANES:
+            if self._queues[lane] and self._running[lane] < self._limits[lane]:
+                index = self._ready_index(lane)
+                if index is not None:
+                    ready[lane] = index
+        if not ready:
+            return None
+        eligible = [lane for lane in LANES if lane in ready]
+
+        # The lane passed over most often is served first once it's starved,
+        # otherwise lanes are served by priority.
+        lane = max(eligible, key=lambda lane: self._passed[lane])
+        if self._passed[lane] < self._fairness:
+            lane = eligible[0]
+
+        for other in eligible:
+            self._passed[other] += 1
+        self._passed[lane] = 0
+
+        queue = self._queues[lane]
+        entry = queue[ready[lane]]
+        del queue[ready[lane]]
+        return (lane, entry)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                call = self._next_call()
+                while not call:
+                    if self._shutdown and not any(self._queues.values()):
+                        return
+                    self._cond.wait()
+                    call = self._next_call()
+
+                (lane, entry) = call
+                self._running[lane] += 1
+
+            self._run(lane, entry)
+
+    def _run(self, lane, entry):
+        (fn, args, future, filename, _) = entry
+        if not future.set_running_or_notify_cancel():
+            self._release(lane, filename)
+            return
+
+        try:
+            result = fn(*args)
+        except Exception as error:  # pylint: disable=broad-except
+            future.set_exception(error)
+            self._release(lane, filename)
+            return
+
+        if "add_done_callback" not in dir(result):
+            future.set_result(result)
+            self._release(lane, filename)
+            return
+
+        def on_done(f):
+            try:
+                future.set_result(f.result())
+            except Exception as error:  # pylint: disable=broad-except
+                future.set_exception(error)
+            self._release(lane, filename)
+
+        result.add_done_callback(on_done)
+
+    def _release(self, lane, filename):
+        with self._cond:
+            self._running[lane] -= 1
+            self._completed[lane] += 1
+            if filename is not None:
+                # The completed call was at the head of the file's calls.
+                calls = self._file_calls[filename]
+                calls.popleft()
+                if not calls:
+                    del self._file_calls[filename]
+            self._cond.notify_all()
@@ -0,0 +1,71 @@
+import os
+import re
+
+import yaml
+
+
+def read_schema(filename):
+    thisdir = os.path.dirname(__file__)
+    path = os.path.join(thisdir, filename)
+    with open(path) as schema_file:
+        return yaml.safe_load(schema_file)
+
+
+class FastItemCheck(object):
+    # A quick check of push item dicts against the push item schema, for the
+    # most common cases.
+    #
+    # Checking against the schema via jsonschema is relatively expensive,
+    # so common items are checked here first. This returns True only for
+    # items known to be valid; anything else should be validated via
+    # jsonschema, which also produces the appropriate error.
+
+    def __init__(self, schema):
+        properties = schema["properties"]
+        self._states = frozenset(properties["state"]["enum"])
+        self._optional_strings = tuple(
+            name
+            for (name, prop) in properties.items()
+            if prop.get("anyOf") == [{"type": "null"}, {"type": "string"}]
+        )
+        self._known = frozenset(
+            ("filename", "state", "checksums") + self._optional_strings
+        )
+
+        # Each checksum is checked by the pattern given in the schema, using
+        # re.search as jsonschema does.
+        checksums = [
+            option
+            for option in properties["checksums"]["anyOf"]
+            if option.get("type") == "object"
+        ][0]
+        self._checksum_patterns = dict(
+            (name, re.compile(prop["pattern"]).search)
+            for (name, prop) in checksums["properties"].items()
+        )
+
+    def __call__(self, item):
+        if not isinstance(item, dict) or not self._known.issuperset(item):
+            return False
+
+        if (
+            type(item.get("filename")) is not str
+            or item.get("state") not in self._states
+        ):
+            return False
+
+        for name in self._optional_strings:
+            value = item.get(name)
+            if value is not None and type(value) is not str:
+                return False
+
+        checksums = item.get("checksums")
+        if checksums is not None:
+            if type(checksums) is not dict:
+                return False
+            for (name, value) in checksums.items():
+                search = self._checksum_patterns.get(name)
+                if not search or type(value) is not str or not search(value):
+                    return False
+
+        return True
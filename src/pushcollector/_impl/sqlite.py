@@ -0,0 +1,265 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+LOG = logging.getLogger("pushcollector")
+
+# Name of the database in the artifacts directory, if no path is given.
+DB_BASENAME = "pushcollector.db"
+
+# Needed for upserts (INSERT ... ON CONFLICT DO UPDATE).
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+ITEM_COLUMNS = (
+    "filename",
+    "dest",
+    "state",
+    "src",
+    "checksums",
+    "origin",
+    "build",
+    "signing_key",
+)
+
+# SQLite considers NULLs distinct in unique indexes, so a NULL dest is
+# mapped to a value which can't otherwise occur.
+ITEM_KEY = "filename, ifnull(dest, x'00')"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS push_items (
+    filename TEXT NOT NULL,
+    dest TEXT,
+    state TEXT NOT NULL,
+    src TEXT,
+    checksums TEXT,
+    origin TEXT,
+    build TEXT,
+    signing_key TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS push_items_key ON push_items({key});
+CREATE INDEX IF NOT EXISTS push_items_state ON push_items(state);
+CREATE INDEX IF NOT EXISTS push_items_build ON push_items(build);
+CREATE INDEX IF NOT EXISTS push_items_origin ON push_items(origin);
+
+CREATE TABLE IF NOT EXISTS push_item_history (
+    seq INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    dest TEXT,
+    state TEXT NOT NULL,
+    src TEXT,
+    checksums TEXT,
+    origin TEXT,
+    build TEXT,
+    signing_key TEXT
+);
+
+CREATE TABLE IF NOT EXISTS attachments (
+    filename TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    content BLOB,
+    path TEXT
+);
+""".format(
+    key=ITEM_KEY
+)
+
+UPSERT_ITEM = """
+INSERT INTO push_items({columns}) VALUES ({params})
+ON CONFLICT({key}) DO UPDATE SET {updates}
+""".format(
+    columns=", ".join(ITEM_COLUMNS),
+    params=", ".join("?" * len(ITEM_COLUMNS)),
+    key=ITEM_KEY,
+    updates=", ".join(
+        "%s=excluded.%s" % (column, column)
+        for column in ITEM_COLUMNS
+        if column not in ("filename", "dest")
+    ),
+)
+
+INSERT_HISTORY = "INSERT INTO push_item_history({columns}) VALUES ({params})".format(
+    columns=", ".join(ITEM_COLUMNS), params=", ".join("?" * len(ITEM_COLUMNS))
+)
+
+
+def item_row(item):
+    checksums = item.get("checksums")
+    if checksums is not None:
+        checksums = json.dumps(checksums, sort_keys=True)
+    return (
+        item["filename"],
+        item.get("dest"),
+        item["state"],
+        item.get("src"),
+        checksums,
+        item.get("origin"),
+        item.get("build"),
+        item.get("signing_key"),
+    )
+
+
+class SqliteCollector(object):
+    """A collector backend writing data to a SQLite database.
+
+    This backend is registered as "sqlite". It may be re-registered with
+    non-default arguments, e.g.:
+
+    .. code-block:: python
+
+        Collector.register_backend(
+            "sqlite", lambda: SqliteCollector(path="push.db", history=True)
+        )
+
+    The database contains the following tables:
+
+    ``push_items``
+        The latest state of each push item, unique per "filename" and "dest".
+        Each column holds the field of the same name from the :ref:`schema`,
+        with "checksums" stored as JSON. Indexes are provided on "state",
+        "build" and "origin".
+
+    ``push_item_history``
+        If ``history`` is enabled, every recorded push item, in order;
+        "seq" holds the order in which items were recorded.
+
+    ``attachments``
+        Content of files from ``attach_file`` and ``append_file``. Small
+        files are stored in the "content" column, while larger files are
+        stored externally, with "path" holding the file's location.
+
+    Parameters:
+        path (str)
+            Path to the database file. Defaults to
+            ``artifacts/<timestamp>/pushcollector.db`` under the current
+            working directory.
+
+        history (bool)
+            If True, every recorded push item is also added to the
+            ``push_item_history`` table.
+
+        blob_threshold (int)
+            Files larger than this many bytes are stored outside of the
+            database, in a ``<path>.files`` directory.
+
+    This backend requires SQLite 3.24.0 or later.
+
+    .. versionadded:: 1.4.0
+    """
+
+    def __init__(self, path=None, history=False, blob_threshold=1024 * 1024):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(
+                "The sqlite backend requires SQLite %s or later, but this "
+                "Python uses SQLite %s"
+                % (".".join(map(str, MIN_SQLITE_VERSION)), sqlite3.sqlite_version)
+            )
+
+        if path is None:
+            path = os.path.join(os.getcwd(), "artifacts", self.timestamp(), DB_BASENAME)
+        self._path = path
+        self._files_dir = path + ".files"
+        self._history = history
+        self._blob_threshold = blob_threshold
+
+        # SQLite serializes writes anyway, so a single connection is shared
+        # between threads.
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @classmethod
+    def timestamp(cls):
+        return datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def _connect(self):
+        # Must be called with lock held.
+        if self._conn:
+            return self._conn
+
+        parent_dir = os.path.dirname(os.path.abspath(self._path))
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir)
+
+        LOG.info("Logging to %s", self._path)
+        conn = sqlite3.connect(self._path, check_same_thread=False)
+
+        # With write-ahead logging, each transaction needs only a sequential
+        # append to the log, and readers don't block the writer.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with conn:
+            conn.executescript(SCHEMA)
+
+        self._conn = conn
+        return conn
+
+    def update_push_items(self, items):
+        rows = [item_row(item) for item in items]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(UPSERT_ITEM, rows)
+                if self._history:
+                    conn.executemany(INSERT_HISTORY, rows)
+
+    def attach_file(self, filename, content):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._store(conn, filename, content)
+
+    def append_file(self, filename, content):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                row = conn.execute(
+                    "SELECT content, path FROM attachments WHERE filename=?",
+                    (filename,),
+                ).fetchone()
+
+                if row and row[1]:
+                    self._write_external(row[1], content, "ab")
+                    conn.execute(
+                        "UPDATE attachments SET size=size+? WHERE filename=?",
+                        (len(content), filename),
+                    )
+                else:
+                    # Stored externally once it outgrows the threshold.
+                    old = bytes(row[0]) if row else b""
+                    self._store(conn, filename, old + content)
+
+    def _store(self, conn, filename, content):
+        path = os.path.join(self._files_dir, filename)
+        if len(content) > self._blob_threshold:
+            self._write_external(path, content, "wb")
+            blob = None
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            path = None
+            blob = sqlite3.Binary(content)
+
+        conn.execute(
+            "INSERT OR REPLACE INTO attachments(filename, size, content, path) "
+            "VALUES (?, ?, ?, ?)",
+            (filename, len(content), blob, path),
+        )
+
+    @classmethod
+    def _write_external(cls, path, content, mode):
+        parent_dir = os.path.dirname(path)
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir)
+        with open(path, mode) as file:
+            file.write(content)
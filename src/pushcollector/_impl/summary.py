@@ -0,0 +1,130 @@
+import collections
+import threading
+
+# Grouping of states as documented in the push item schema.
+# Legacy states are grouped with whichever modern state they correspond to.
+# Every state in the schema must be listed in exactly one of these.
+SUCCESSFUL_STATES = frozenset(
+    [
+        "PUSHED",
+        "PENDING",
+        "EXISTS",
+        "DELETED",
+        "MISSING",
+        "SKIPPED",
+        "PUBLISHED",
+        "EXPORTED",
+    ]
+)
+
+UNSUCCESSFUL_STATES = frozenset(
+    [
+        "UNKNOWN",
+        "ONSERVER",
+        "NOTFOUND",
+        "UPLOADFAILED",
+        "INVALIDFILE",
+        "UNSIGNED",
+        "CHECKSUM",
+        "SUBSCRIPTION",
+        "NOTPUSHED",
+        "DOCKERTAGMISMATCH",
+    ]
+)
+
+
+def is_successful(state):
+    return state in SUCCESSFUL_STATES
+
+
+class PushItemSummary(object):
+    # Running aggregates over push items passed through update_push_items.
+    #
+    # Only the latest state of each (filename, dest) is counted; when an item
+    # changes state, its previous contribution to each count is withdrawn.
+    # This keeps summaries proportional to the number of distinct states
+    # (and failed items), rather than the number of items ever recorded.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._states = collections.Counter()
+        self._builds = collections.defaultdict(collections.Counter)
+        self._dests = collections.defaultdict(collections.Counter)
+        self._failures = {}
+
+    def __len__(self):
+        return len(self._latest)
+
+    def update(self, items):
+        with self._lock:
+            for item in items:
+                self._update_one(item)
+
+    def _update_one(self, item):
+        key = (item["filename"], item.get("dest"))
+        build = item.get("build")
+        state = item["state"]
+
+        old = self._latest.get(key)
+        if old:
+            self._count(key, old[0], old[1], -1)
+        self._latest[key] = (state, build)
+        self._count(key, state, build, 1)
+
+    def _count(self, key, state, build, delta):
+        dest = key[1]
+        self._adjust(self._states, state, delta)
+        if build is not None:
+            self._adjust_nested(self._builds, build, state, delta)
+        if dest is not None:
+            self._adjust_nested(self._dests, dest, state, delta)
+
+        if is_successful(state):
+            pass
+        elif delta > 0:
+            self._failures[key] = state
+        else:
+            del self._failures[key]
+
+    @classmethod
+    def _adjust(cls, counter, state, delta):
+        counter[state] += delta
+        if not counter[state]:
+            del counter[state]
+
+    @classmethod
+    def _adjust_nested(cls, counters, name, state, delta):
+        cls._adjust(counters[name], state, delta)
+        if not counters[name]:
+            del counters[name]
+
+    def get(self):
+        with self._lock:
+            states = dict(self._states)
+            return {
+                "total": len(self._latest),
+                "states": states,
+                "successful": dict(
+                    (state, count)
+                    for (state, count) in states.items()
+                    if is_successful(state)
+                ),
+                "unsuccessful": dict(
+                    (state, count)
+                    for (state, count) in states.items()
+                    if not is_successful(state)
+                ),
+                "builds": dict(
+                    (build, dict(counts)) for (build, counts) in self._builds.items()
+                ),
+                "dests": dict(
+                    (dest, dict(counts)) for (dest, counts) in self._dests.items()
+                ),
+                "failures": [
+                    {"filename": filename, "dest": dest, "state": state}
+                    for ((filename, dest), state) in sorted(
+                        self._failures.items(),
+                        key=lambda kv: (kv[0][0], kv[0][1] or ""),
+                    )
+                ],
+            }
@@ -0,0 +1,124 @@
+import collections
+import contextlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+LOG = logging.getLogger("pushcollector")
+
+
+def now_us():
+    return time.perf_counter() * 1000000
+
+
+class NullTracer(object):
+    # Tracer used when tracing is disabled; every operation is a no-op.
+    class _Span(object):
+        def __enter__(self):
+            return {}
+
+        def __exit__(self, *args):
+            pass
+
+    _SPAN = _Span()
+
+    def span(self, name, **args):
+        return self._SPAN
+
+    def track_future(self, name, future, **args):
+        return future
+
+    def write(self):
+        pass
+
+
+class Tracer(object):
+    # Records spans of collector calls as Chrome trace events, which can be
+    # loaded into chrome://tracing, Perfetto and similar viewers.
+    #
+    # Events are kept in a bounded deque. Appending to a deque is atomic,
+    # so recording an event never takes a lock; once the buffer is full,
+    # the oldest events are discarded, and a warning is logged when the
+    # trace is written.
+    DEFAULT_CAPACITY = 100000
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self._path = path
+        self._capacity = capacity
+        self._events = collections.deque(maxlen=capacity)
+        # Counts recorded events; like appending to a deque, next() on a
+        # count is atomic.
+        self._recorded = itertools.count()
+        self._ids = itertools.count()
+        self._pid = os.getpid()
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        # Yields args so that the caller may add more info to the span
+        # while it's in progress.
+        start = now_us()
+        try:
+            yield args
+        finally:
+            self._record(
+                {
+                    "name": name,
+                    "cat": "collector",
+                    "ph": "X",
+                    "ts": start,
+                    "dur": now_us() - start,
+                    "pid": self._pid,
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }
+            )
+
+    def track_future(self, name, future, **args):
+        # Resolution of a future may complete on any thread, long after the
+        # call returned, so it's recorded as an async event pair.
+        event_id = next(self._ids)
+        event = {
+            "name": name,
+            "cat": "collector",
+            "id": event_id,
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+        }
+        self._record(dict(event, ph="b", ts=now_us(), args=args))
+
+        def on_done(f):
+            args = {"error": repr(f.exception())} if f.exception() else {}
+            self._record(
+                dict(
+                    event,
+                    ph="e",
+                    ts=now_us(),
+                    tid=threading.get_ident(),
+                    args=args,
+                )
+            )
+
+        future.add_done_callback(on_done)
+        return future
+
+    def _record(self, event):
+        next(self._recorded)
+        self._events.append(event)
+
+    def write(self):
+        events = list(self._events)
+        dropped = next(self._recorded) - len(events)
+        with open(self._path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        LOG.info("Wrote collector trace to %s", self._path)
+        if dropped > 0:
+            LOG.warning(
+                "Collector trace %s is incomplete: the oldest %s event(s) were "
+                "dropped, as only %s events are kept",
+                self._path,
+                dropped,
+                self._capacity,
+            )
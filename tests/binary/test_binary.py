@@ -0,0 +1,210 @@
+import io
+import json
+
+import pytest
+
+from pushcollector import (
+    Collector,
+    LocalCollector,
+    read_push_items,
+    jsonl_to_binary,
+    binary_to_jsonl,
+)
+from pushcollector._impl import binary
+from pushcollector._impl.binary import BinaryWriter, read_binary_push_items
+from pushcollector._impl.schema import read_schema
+
+ITEMS = [
+    {"filename": "file1", "state": "PENDING"},
+    {
+        "filename": "file1",
+        "state": "PUSHED",
+        "src": "/some/dir/file1",
+        "dest": "repo1",
+        "checksums": {
+            "md5": "bb1b0d528129f47798006e73307ba7a7",
+            "sha256": "4fd23ae44f3366f12f769f82398e96dce72adab8e45dea4d721ddf43fdce31e2",
+        },
+        "origin": "RHBA-1234",
+        "build": "test_build-1.0.0-1",
+        "signing_key": "FD431D51",
+    },
+    {
+        "filename": "file2",
+        "state": "UPLOADFAILED",
+        "src": None,
+        "dest": "repo1",
+        "checksums": None,
+        "origin": "RHBA-1234",
+        "build": None,
+        "signing_key": None,
+    },
+    {"filename": "file3", "state": "EXISTS", "checksums": {}, "other": [1, 2]},
+    {"filename": "fileé", "state": "DOCKERTAGMISMATCH", "dest": "repoé"},
+]
+
+
+def test_local_binary_roundtrip(tmpdir, monkeypatch):
+    """local collector can write push items in binary format, which are read
+    back identically to the recorded items."""
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(LocalCollector, "timestamp", lambda cls: "time1")
+
+    Collector.register_backend(
+        "local-binary", lambda: LocalCollector(pushitems_format="binary")
+    )
+    try:
+        collector = Collector.get("local-binary")
+        collector.update_push_items(ITEMS[:2]).result()
+        collector.update_push_items(ITEMS[2:]).result()
+    finally:
+        Collector.register_backend("local-binary", None)
+
+    path = tmpdir.join("artifacts", "time1", "pushitems.bin")
+    assert list(read_push_items(str(path))) == ITEMS
+
+    # Strings are only stored once, so the file is smaller than JSONL
+    jsonl = "".join(json.dumps(item, sort_keys=True) + "\n" for item in ITEMS)
+    assert path.size() < len(jsonl)
+
+
+def test_local_binary_single_writer(tmpdir, monkeypatch):
+    """A binary push items file can't be shared between collectors, so a
+    second collector writing to the same file fails without corrupting it."""
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(LocalCollector, "timestamp", lambda cls: "time1")
+
+    first = LocalCollector(pushitems_format="binary")
+    second = LocalCollector(pushitems_format="binary")
+
+    first.update_push_items(ITEMS[:1])
+    with pytest.raises(RuntimeError) as excinfo:
+        second.update_push_items(ITEMS[1:2])
+    first.update_push_items(ITEMS[2:])
+
+    assert "created by another collector" in str(excinfo.value)
+
+    path = tmpdir.join("artifacts", "time1", "pushitems.bin")
+    assert list(read_push_items(str(path))) == ITEMS[:1] + ITEMS[2:]
+
+
+def test_failed_write_keeps_no_strings():
+    """Strings from a failed write aren't referenced by later writes."""
+    writer = BinaryWriter()
+    chunks = []
+
+    def fail(data):
+        raise IOError("write failed")
+
+    writer.write(chunks.append, [{"filename": "file1", "state": "PUSHED"}])
+    with pytest.raises(IOError):
+        writer.write(fail, [{"filename": "file2", "state": "PUSHED"}])
+    writer.write(chunks.append, [{"filename": "file2", "state": "PENDING"}])
+
+    data = b"".join(chunks)
+    assert list(read_binary_push_items(io.BytesIO(data))) == [
+        {"filename": "file1", "state": "PUSHED"},
+        {"filename": "file2", "state": "PENDING"},
+    ]
+
+
+def test_convert_lossless(tmpdir):
+    """JSONL files can be converted to binary and back without changes."""
+    jsonl = "".join(json.dumps(item, sort_keys=True) + "\n" for item in ITEMS)
+    src = tmpdir.join("pushitems.jsonl")
+    src.write(jsonl)
+
+    jsonl_to_binary(str(src), str(tmpdir.join("pushitems.bin")))
+    binary_to_jsonl(str(tmpdir.join("pushitems.bin")), str(tmpdir.join("out.jsonl")))
+
+    assert list(read_push_items(str(src))) == ITEMS
+    assert tmpdir.join("out.jsonl").read() == jsonl
+
+
+def test_read_large_records(monkeypatch):
+    """Reader handles records spanning several chunks."""
+    monkeypatch.setattr(binary, "CHUNK_SIZE", 100)
+    writer = BinaryWriter()
+    items = [{"filename": "x" * 5000, "state": "PUSHED"}] * 3
+    file = io.BytesIO(writer.encode(items[:1]) + writer.encode(items[1:]))
+
+    assert list(read_binary_push_items(file)) == items
+
+
+def test_failed_encode_writes_nothing():
+    """A failed encode leaves the writer usable, with no dangling strings."""
+    writer = BinaryWriter()
+    with pytest.raises(ValueError):
+        writer.encode(
+            [
+                {"filename": "file1", "state": "PUSHED"},
+                {"filename": "file2", "state": "BAD"},
+            ]
+        )
+
+    data = writer.encode([{"filename": "file2", "state": "PUSHED"}])
+    assert list(read_binary_push_items(io.BytesIO(data))) == [
+        {"filename": "file2", "state": "PUSHED"}
+    ]
+
+
+def test_all_states_encoded():
+    """Every state in the schema has a code in the binary format.
+
+    If this fails, append the new state to binary.STATES; existing codes
+    must not change."""
+
+    schema_states = read_schema("pushitem.yaml")["properties"]["state"]["enum"]
+
+    assert sorted(set(schema_states) - set(binary.STATES)) == []
+    assert len(set(binary.STATES)) == len(binary.STATES)
+
+
+def test_state_codes_stable():
+    """State codes of existing files don't change."""
+
+    content = binary.MAGIC + bytes(
+        [
+            # STRING "f"
+            binary.RECORD_STRING,
+            1,
+            ord("f"),
+            # ITEMs with no optional fields, for codes 0, 15 and 17
+            binary.RECORD_ITEM,
+            4,
+            0,
+            0,
+            0,
+            0,
+            binary.RECORD_ITEM,
+            4,
+            15,
+            0,
+            0,
+            0,
+            binary.RECORD_ITEM,
+            4,
+            17,
+            0,
+            0,
+            0,
+        ]
+    )
+
+    assert [item["state"] for item in read_binary_push_items(io.BytesIO(content))] == [
+        "PUSHED",
+        "PUBLISHED",
+        "DOCKERTAGMISMATCH",
+    ]
+
+
+def test_read_invalid():
+    """Reader rejects files which are not valid binary push item files."""
+    with pytest.raises(ValueError) as excinfo:
+        list(read_binary_push_items(io.BytesIO(b"{}\n")))
+    assert "Not a binary push items file" in str(excinfo.value)
+
+    data = BinaryWriter().encode([{"filename": "file1", "state": "PUSHED"}])
+    with pytest.raises(ValueError) as excinfo:
+        list(read_binary_push_items(io.BytesIO(data[:-1])))
+    assert "Truncated binary push items file" in str(excinfo.value)
@@ -16,6 +16,9 @@ def test_unimplemented():
     with pytest.raises(NotImplementedError):
         collector.append_file("somefile.txt", "foobar")
 
+    with pytest.raises(NotImplementedError):
+        collector.summary()
+
 
 def test_base_class_context_manager():
     """Exercise the __enter__ and __exit__ methods of Collector."""
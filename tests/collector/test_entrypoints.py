@@ -0,0 +1,192 @@
+import pytest
+
+try:
+    from importlib import metadata
+except ImportError:  # pragma: no cover
+    # Python < 3.8
+    import importlib_metadata as metadata
+
+from pushcollector import Collector
+from pushcollector._impl import collector as collector_module
+from pushcollector._impl.entrypoints import BACKENDS_GROUP, backend_entry_points
+
+
+class FakeEntryPoint(object):
+    def __init__(self, name, factory):
+        self.name = name
+        self.value = "fake.module:%s" % name
+        self.factory = factory
+        self.load_count = 0
+
+    def load(self):
+        self.load_count += 1
+        return self.factory
+
+
+class EntryPointCollector(object):
+    INSTANCES = []
+
+    def __init__(self):
+        EntryPointCollector.INSTANCES.append(self)
+        self.pushed = []
+
+    def update_push_items(self, items):
+        self.pushed.extend(items)
+
+
+@pytest.fixture
+def entry_points(monkeypatch):
+    """Replaces installed entry points with fakes, and cleans up any backends
+    loaded from them."""
+
+    out = {
+        "ep-backend": FakeEntryPoint("ep-backend", EntryPointCollector),
+        "ep-other": FakeEntryPoint("ep-other", EntryPointCollector),
+        "local": FakeEntryPoint("local", EntryPointCollector),
+    }
+    scan_count = []
+
+    def fake_backend_entry_points():
+        scan_count.append(None)
+        return out.copy()
+
+    monkeypatch.setattr(
+        collector_module, "backend_entry_points", fake_backend_entry_points
+    )
+    monkeypatch.setattr(Collector, "_ENTRY_POINTS", None)
+    monkeypatch.setattr(Collector, "_REGISTERED", set(Collector._REGISTERED))
+    monkeypatch.setattr(Collector, "_BACKENDS", Collector._BACKENDS.copy())
+    monkeypatch.setattr(Collector, "_DEFAULT_BACKEND", Collector._INITIAL_BACKEND)
+
+    out["scan_count"] = scan_count
+    yield out
+
+
+def test_get_loads_entry_point(entry_points):
+    """A backend provided by an entry point is loaded only once requested."""
+
+    Collector.get("local")
+    assert not entry_points["scan_count"]
+
+    collector = Collector.get("ep-backend")
+    collector.update_push_items([{"filename": "a", "state": "PENDING"}]).result()
+    Collector.get("ep-backend")
+
+    # It should have used the backend from the entry point
+    assert EntryPointCollector.INSTANCES[-2].pushed == [
+        {"filename": "a", "state": "PENDING"}
+    ]
+
+    # Entry points were scanned and loaded once, and only the requested one
+    assert len(entry_points["scan_count"]) == 1
+    assert entry_points["ep-backend"].load_count == 1
+    assert entry_points["ep-other"].load_count == 0
+
+
+def test_set_default_loads_entry_point(entry_points):
+    """set_default_backend can use a backend provided by an entry point."""
+
+    Collector.set_default_backend("ep-other")
+
+    assert entry_points["ep-other"].load_count == 1
+    assert entry_points["ep-backend"].load_count == 0
+
+    Collector.get()
+    assert isinstance(EntryPointCollector.INSTANCES[-1], EntryPointCollector)
+
+
+def test_registered_backend_takes_precedence(entry_points):
+    """Entry points don't replace backends registered explicitly."""
+
+    class MyCollector(object):
+        pass
+
+    Collector.register_backend("ep-backend", MyCollector)
+    Collector.get("ep-backend")
+    Collector.get("local")
+
+    assert entry_points["ep-backend"].load_count == 0
+    assert entry_points["local"].load_count == 0
+
+
+def test_unregistered_backend_not_loaded(entry_points):
+    """A backend unregistered by name is not reloaded from its entry point."""
+
+    Collector.get("ep-backend")
+    Collector.register_backend("ep-backend", None)
+
+    with pytest.raises(ValueError) as excinfo:
+        Collector.get("ep-backend")
+
+    assert "No registered pushcollector backend: 'ep-backend'" in str(excinfo.value)
+    assert entry_points["ep-backend"].load_count == 1
+
+
+def test_missing_backend(entry_points):
+    """Requesting a backend with neither registration nor entry point fails."""
+
+    with pytest.raises(ValueError) as excinfo:
+        Collector.get("not-registered")
+
+    assert "No registered pushcollector backend: 'not-registered'" in str(excinfo.value)
+
+
+class FakeMetadataEntryPoint(object):
+    def __init__(self, name, value, group):
+        self.name = name
+        self.value = value
+        self.group = group
+
+
+class FakeSelectable(object):
+    # Mimics EntryPoints as returned by importlib.metadata on Python >= 3.10
+    def __init__(self, entry_points):
+        self._entry_points = entry_points
+
+    def select(self, group):
+        return [ep for ep in self._entry_points if ep.group == group]
+
+
+INSTALLED = [
+    FakeMetadataEntryPoint("backend1", "mod1:Collector", BACKENDS_GROUP),
+    FakeMetadataEntryPoint("other", "mod2:main", "console_scripts"),
+    FakeMetadataEntryPoint("backend2", "mod2:Collector", BACKENDS_GROUP),
+    FakeMetadataEntryPoint("backend1", "mod3:Collector", BACKENDS_GROUP),
+]
+
+
+@pytest.mark.parametrize(
+    "installed",
+    [
+        FakeSelectable(INSTALLED),
+        # Python < 3.10: a dict keyed by group
+        {
+            BACKENDS_GROUP: [ep for ep in INSTALLED if ep.group == BACKENDS_GROUP],
+            "console_scripts": [INSTALLED[1]],
+        },
+    ],
+    ids=["select", "dict"],
+)
+def test_installed_entry_points(monkeypatch, caplog, installed):
+    """Backends are listed from installed entry points, ignoring duplicates."""
+
+    monkeypatch.setattr(metadata, "entry_points", lambda: installed)
+
+    found = backend_entry_points()
+
+    assert {name: ep.value for (name, ep) in found.items()} == {
+        "backend1": "mod1:Collector",
+        "backend2": "mod2:Collector",
+    }
+    assert (
+        "Ignoring duplicate pushcollector backend 'backend1' from mod3:Collector"
+        in caplog.text
+    )
+
+
+def test_no_installed_entry_points(monkeypatch):
+    """No backends are listed if no distribution provides any."""
+
+    monkeypatch.setattr(metadata, "entry_points", lambda: {})
+
+    assert backend_entry_points() == {}
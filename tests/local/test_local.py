@@ -1,7 +1,15 @@
+import json
 import logging
+import os
+import tarfile
 import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
 
 from pushcollector import Collector
+from pushcollector._impl import durability
 from pushcollector._impl.local import LocalCollector
 
 
@@ -99,3 +107,255 @@ def test_local_dir_sequence(tmpdir, monkeypatch):
 
     # and latest should be a symlink to the last created timestamp dir
     assert artifactsdir.join("latest").readlink() == "time3"
+
+
+def test_local_bundle(tmpdir, monkeypatch):
+    """local collector with bundle enabled streams all artifacts into a
+    compressed tar archive, finalized on exit."""
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(LocalCollector, "timestamp", lambda cls: "time1")
+
+    Collector.register_backend("local-bundle", lambda: LocalCollector(bundle="gz"))
+    try:
+        with Collector.get("local-bundle") as collector:
+            collector.update_push_items(
+                [{"filename": "file1", "state": "PENDING"}]
+            ).result()
+            collector.attach_file("some-file.txt", "Hello, world\n").result()
+            collector.append_file("appended-file.txt", "chunk 1\n").result()
+            collector.update_push_items(
+                [{"filename": "file1", "state": "PUSHED"}]
+            ).result()
+            collector.append_file("appended-file.txt", "chunk 2\n").result()
+    finally:
+        Collector.register_backend("local-bundle", None)
+
+    bundle = tmpdir.join("artifacts", "time1.tar.gz")
+    with tarfile.open(str(bundle), "r:gz") as tar:
+        names = tar.getnames()
+        contents = dict((name, tar.extractfile(name).read()) for name in names)
+
+    # Every file should be present exactly once, with final content
+    assert sorted(names) == [
+        "time1/appended-file.txt",
+        "time1/pushitems.jsonl",
+        "time1/some-file.txt",
+        "time1/summary.json",
+    ]
+    assert contents["time1/some-file.txt"] == b"Hello, world\n"
+    assert contents["time1/appended-file.txt"] == b"chunk 1\nchunk 2\n"
+    assert contents["time1/pushitems.jsonl"] == (
+        tmpdir.join("artifacts", "time1", "pushitems.jsonl").read_binary()
+    )
+
+
+def test_local_bundle_single_writer(tmpdir, monkeypatch):
+    """A bundle can't be shared between collectors, so a second collector
+    bundling to the same archive fails without clobbering it."""
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(LocalCollector, "timestamp", lambda cls: "time1")
+
+    first = LocalCollector(bundle="gz")
+    second = LocalCollector(bundle="gz")
+
+    with first:
+        first.attach_file("first.txt", b"first\n")
+        with pytest.raises(RuntimeError) as excinfo:
+            with second:
+                second.attach_file("second.txt", b"second\n")
+
+    assert "created by another collector" in str(excinfo.value)
+
+    bundle = tmpdir.join("artifacts", "time1.tar.gz")
+    with tarfile.open(str(bundle), "r:gz") as tar:
+        assert tar.getnames() == ["time1/first.txt"]
+
+
+def test_local_bundle_rewritten_files(tmpdir, monkeypatch):
+    """Files written more than once appear in the bundle only once, with
+    their final content."""
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(LocalCollector, "timestamp", lambda cls: "time1")
+
+    collector = LocalCollector(bundle="none")
+    with collector:
+        collector.attach_file("a.txt", b"old")
+        collector.attach_file("b.txt", b"only once")
+        collector.attach_file("a.txt", b"new")
+        collector.attach_file("log", b"header\n")
+        collector.append_file("log", b"line\n")
+        collector.append_file("c.log", b"line\n")
+        collector.attach_file("c.log", b"replaced\n")
+
+    bundle = tmpdir.join("artifacts", "time1.tar")
+    with tarfile.open(str(bundle), "r") as tar:
+        names = tar.getnames()
+        contents = dict((name, tar.extractfile(name).read()) for name in names)
+
+    assert sorted(names) == [
+        "time1/a.txt",
+        "time1/b.txt",
+        "time1/c.log",
+        "time1/log",
+    ]
+    assert contents == {
+        "time1/a.txt": b"new",
+        "time1/b.txt": b"only once",
+        "time1/c.log": b"replaced\n",
+        "time1/log": b"header\nline\n",
+    }
+
+
+def test_local_bundle_bad_compression():
+    """local collector rejects unknown bundle compression."""
+    with pytest.raises(ValueError) as excinfo:
+        LocalCollector(bundle="zip")
+    assert "Unsupported bundle compression: 'zip'" in str(excinfo.value)
+
+
+def test_local_concurrent_writes(tmpdir, monkeypatch):
+    """local collector can be shared between threads without interleaving
+    partial records."""
+    monkeypatch.chdir(tmpdir)
+
+    collector = Collector.get("local")
+    thread_count = 8
+    batches = 20
+
+    def work(thread_id):
+        for i in range(batches):
+            collector.update_push_items(
+                [
+                    {"filename": "file-%s-%s-%s" % (thread_id, i, j), "state": "PUSHED"}
+                    for j in range(5)
+                ]
+            ).result()
+            collector.append_file("log.txt", "thread %s line %s\n" % (thread_id, i))
+            collector.attach_file("status.txt", "thread %s" % thread_id)
+
+    with ThreadPoolExecutor(thread_count) as executor:
+        list(executor.map(work, range(thread_count)))
+
+    artifactsdir = tmpdir.join("artifacts", "latest")
+
+    # Every record should be intact, and none lost
+    lines = artifactsdir.join("pushitems.jsonl").read().splitlines()
+    filenames = sorted(json.loads(line)["filename"] for line in lines)
+    assert filenames == sorted(
+        "file-%s-%s-%s" % (t, i, j)
+        for t in range(thread_count)
+        for i in range(batches)
+        for j in range(5)
+    )
+
+    log_lines = artifactsdir.join("log.txt").read().splitlines()
+    assert sorted(log_lines) == sorted(
+        "thread %s line %s" % (t, i)
+        for t in range(thread_count)
+        for i in range(batches)
+    )
+
+    # Attached file holds exactly one writer's content, with no temp files left
+    assert artifactsdir.join("status.txt").read().startswith("thread ")
+    assert sorted(p.basename for p in artifactsdir.listdir()) == [
+        "log.txt",
+        "pushitems.jsonl",
+        "status.txt",
+    ]
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    """Records paths synced by the local collector, rather than syncing."""
+    synced = []
+
+    def sync_path(path):
+        time.sleep(0.01)
+        synced.append(os.path.basename(path))
+
+    monkeypatch.setattr(durability, "sync_path", sync_path)
+    return synced
+
+
+def test_local_durability_exit(tmpdir, monkeypatch, synced):
+    """local collector with 'exit' durability syncs all files on exit."""
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(LocalCollector, "timestamp", lambda cls: "time1")
+
+    with LocalCollector(durability="exit") as collector:
+        assert (
+            collector.update_push_items([{"filename": "f", "state": "PUSHED"}]) is None
+        )
+        collector.attach_file("some-file.txt", b"abc")
+        collector.append_file("log.txt", b"abc")
+        assert synced == []
+
+    # Files synced before directories
+    assert sorted(synced[:3]) == ["log.txt", "pushitems.jsonl", "some-file.txt"]
+    assert sorted(synced[3:]) == ["artifacts", "time1"]
+
+
+def test_local_durability_periodic(tmpdir, monkeypatch, synced):
+    """local collector with 'periodic' durability syncs files in background."""
+    monkeypatch.chdir(tmpdir)
+
+    with LocalCollector(durability="periodic", fsync_interval=0.01) as collector:
+        collector.append_file("log.txt", b"abc")
+        for _ in range(100):
+            if "log.txt" in synced:
+                break
+            time.sleep(0.01)
+        assert "log.txt" in synced
+
+
+def test_local_durability_group(tmpdir, monkeypatch, synced):
+    """local collector with 'group' durability resolves futures once data is
+    synced, sharing syncs between concurrent writers."""
+    monkeypatch.chdir(tmpdir)
+
+    Collector.register_backend(
+        "local-group", lambda: LocalCollector(durability="group")
+    )
+    try:
+        collector = Collector.get("local-group")
+
+        def work(i):
+            collector.append_file("log.txt", "line %s\n" % i).result()
+            # By the time the future resolves, the file was synced
+            assert "log.txt" in synced
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(work, range(40)))
+
+        with collector:
+            pass
+    finally:
+        Collector.register_backend("local-group", None)
+
+    # Writers shared syncs
+    assert synced.count("log.txt") < 40
+
+
+def test_local_durability_group_error(tmpdir, monkeypatch):
+    """local collector with 'group' durability propagates sync errors
+    through futures."""
+    monkeypatch.chdir(tmpdir)
+    error = OSError("sync failed")
+
+    def sync_path(path):
+        raise error
+
+    monkeypatch.setattr(durability, "sync_path", sync_path)
+
+    collector = LocalCollector(durability="group")
+    assert collector.append_file("log.txt", b"abc").exception() is error
+
+    with pytest.raises(OSError):
+        collector.__exit__(None, None, None)
+
+
+def test_local_durability_bad_mode():
+    """local collector rejects unknown durability mode."""
+    with pytest.raises(ValueError) as excinfo:
+        LocalCollector(durability="sometimes")
+    assert "Unsupported durability mode: 'sometimes'" in str(excinfo.value)
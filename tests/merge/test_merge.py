@@ -0,0 +1,284 @@
+import json
+
+import pytest
+
+from pushcollector import merge_artifacts, read_push_items
+from pushcollector._impl import merge
+from pushcollector._impl.merge import main
+
+
+def make_input(tmpdir, name, items, files=None):
+    path = tmpdir.mkdir(name)
+    path.join("pushitems.jsonl").write(
+        "".join(json.dumps(item, sort_keys=True) + "\n" for item in items)
+    )
+    for (filename, content) in (files or {}).items():
+        path.join(filename).write(content, ensure=True)
+    return str(path)
+
+
+def test_merge_latest_state(tmpdir):
+    """Latest state of each push item is resolved across inputs."""
+
+    in1 = make_input(
+        tmpdir,
+        "in1",
+        [
+            {"filename": "a", "state": "PENDING"},
+            {"filename": "a", "state": "PENDING", "dest": "d1"},
+            {"filename": "a", "state": "PUSHED"},
+        ],
+    )
+    in2 = make_input(
+        tmpdir,
+        "in2",
+        [
+            {"filename": "b", "state": "PENDING"},
+            {"filename": "a", "state": "NOTPUSHED", "dest": "d1"},
+        ],
+    )
+    out = str(tmpdir.join("out"))
+
+    summary = merge_artifacts([in1, in2], out)
+
+    # Items are in order of their latest update
+    assert list(read_push_items(out + "/pushitems.jsonl")) == [
+        {"filename": "a", "state": "PUSHED"},
+        {"filename": "b", "state": "PENDING"},
+        {"filename": "a", "state": "NOTPUSHED", "dest": "d1"},
+    ]
+
+    # Summary is returned and written
+    assert summary["total"] == 3
+    assert summary["states"] == {"PUSHED": 1, "PENDING": 1, "NOTPUSHED": 1}
+    with open(out + "/summary.json") as f:
+        assert json.load(f) == summary
+
+
+def test_merge_order_by(tmpdir, monkeypatch):
+    """Push items from inputs are interleaved according to order_by."""
+
+    # Force several batches per input
+    monkeypatch.setattr(merge, "BATCH_SIZE", 2)
+
+    in1 = make_input(
+        tmpdir,
+        "in1",
+        [
+            {"filename": "a", "state": "PENDING", "seq": 1},
+            {"filename": "b", "state": "PENDING", "seq": 2},
+            {"filename": "a", "state": "PUSHED", "seq": 5},
+        ],
+    )
+    in2 = make_input(
+        tmpdir,
+        "in2",
+        [
+            {"filename": "a", "state": "NOTPUSHED", "seq": 3},
+            {"filename": "b", "state": "PUSHED", "seq": 4},
+            # Recorded out of order; stays after the previous item
+            {"filename": "b", "state": "SKIPPED", "seq": 3},
+        ],
+    )
+    out = str(tmpdir.join("out"))
+
+    merge_artifacts([in1, in2], out, order_by="seq")
+
+    assert list(read_push_items(out + "/pushitems.jsonl")) == [
+        {"filename": "b", "state": "SKIPPED", "seq": 3},
+        {"filename": "a", "state": "PUSHED", "seq": 5},
+    ]
+
+
+def test_merge_order_by_missing(tmpdir):
+    """Merge fails if push items lack the order_by field."""
+
+    in1 = make_input(tmpdir, "in1", [{"filename": "a", "state": "PENDING"}])
+
+    with pytest.raises(ValueError) as excinfo:
+        merge_artifacts([in1], str(tmpdir.join("out")), order_by="seq")
+
+    assert "Push item a in %s/pushitems.jsonl has no 'seq'" % in1 in str(excinfo.value)
+
+
+@pytest.mark.parametrize("value", [[1], True, {"t": 1}])
+def test_merge_order_by_unsupported(tmpdir, value):
+    """Merge fails if order_by values are neither numbers nor strings."""
+
+    in1 = make_input(tmpdir, "in1", [{"filename": "a", "state": "PENDING", "t": value}])
+
+    with pytest.raises(ValueError) as excinfo:
+        merge_artifacts([in1], str(tmpdir.join("out")), order_by="t")
+
+    assert "it must be a number or a string" in str(excinfo.value)
+
+
+def test_merge_order_by_mixed_in_input(tmpdir):
+    """Merge fails if an input mixes numbers and strings in order_by."""
+
+    in1 = make_input(
+        tmpdir,
+        "in1",
+        [
+            {"filename": "a", "state": "PENDING", "t": 1},
+            {"filename": "b", "state": "PENDING", "t": "2020-01-01T00:00:00Z"},
+        ],
+    )
+
+    with pytest.raises(ValueError) as excinfo:
+        merge_artifacts([in1], str(tmpdir.join("out")), order_by="t")
+
+    assert (
+        "Push item b in %s/pushitems.jsonl has a string 't', but earlier push "
+        "items have a number" % in1
+    ) in str(excinfo.value)
+
+
+def test_merge_order_by_mixed_across_inputs(tmpdir):
+    """Merge fails if inputs use different kinds of order_by values."""
+
+    in1 = make_input(tmpdir, "in1", [{"filename": "a", "state": "PENDING", "t": 1}])
+    in2 = make_input(
+        tmpdir,
+        "in2",
+        [{"filename": "b", "state": "PENDING", "t": "2020-01-01T00:00:00Z"}],
+    )
+
+    with pytest.raises(ValueError) as excinfo:
+        merge_artifacts([in1, in2], str(tmpdir.join("out")), order_by="t")
+
+    assert "'t' has string values in %s, but number values in %s" % (
+        in2,
+        in1,
+    ) in str(excinfo.value)
+
+
+def test_merge_both_formats(tmpdir):
+    """Merge fails if an input has push items in both formats."""
+
+    in1 = make_input(tmpdir, "in1", [{"filename": "a", "state": "PENDING"}])
+    binary = tmpdir.join("binary")
+    merge_artifacts([in1], str(binary), pushitems_format="binary")
+    binary.join("pushitems.bin").copy(tmpdir.join("in1"))
+
+    with pytest.raises(ValueError) as excinfo:
+        merge_artifacts([in1], str(tmpdir.join("out")))
+
+    assert (
+        "Can't merge %s: it has push items in both pushitems.jsonl and "
+        "pushitems.bin" % in1
+    ) in str(excinfo.value)
+
+
+def test_merge_files(tmpdir, caplog):
+    """Files matching append_files are concatenated in order of inputs; other
+    files are taken from the last input having them."""
+
+    in1 = make_input(
+        tmpdir,
+        "in1",
+        [],
+        {
+            "push.log": "one\n",
+            "only1.txt": "x",
+            "summary.json": "{}",
+            "config.json": "{}",
+            "same.json": "[]",
+        },
+    )
+    in2 = make_input(
+        tmpdir,
+        "in2",
+        [],
+        {"push.log": "two\n", "sub/nested.log": "y", "same.json": "[]"},
+    )
+    in3 = make_input(
+        tmpdir, "in3", [], {"push.log": "three\n", "config.json": '{"a": 1}'}
+    )
+    out = tmpdir.join("out")
+
+    merge_artifacts([in1, in2, in3], str(out), workers=2, append_files=["*.log"])
+
+    assert out.join("push.log").read() == "one\ntwo\nthree\n"
+    assert out.join("only1.txt").read() == "x"
+    assert out.join("sub/nested.log").read() == "y"
+    assert out.join("config.json").read() == '{"a": 1}'
+    assert out.join("same.json").read() == "[]"
+
+    # Only the file with differing content is warned about
+    warnings = [r.getMessage() for r in caplog.records if r.levelname == "WARNING"]
+    assert "Using %s/config.json, which differs from other inputs" % in3 in warnings
+    assert not [w for w in warnings if "same.json" in w]
+
+    # No push items, so no summary
+    assert not out.join("summary.json").exists()
+    assert out.join("pushitems.jsonl").read() == ""
+
+
+def test_merge_skips_sqlite(tmpdir, caplog):
+    """Databases written by the sqlite backend are not copied."""
+
+    in1 = make_input(
+        tmpdir,
+        "in1",
+        [],
+        {
+            "pushcollector.db": "db",
+            "pushcollector.db-wal": "wal",
+            "pushcollector.db.files/big.bin": "data",
+            "other.txt": "x",
+        },
+    )
+    out = tmpdir.join("out")
+
+    merge_artifacts([in1], str(out))
+
+    assert sorted(out.listdir()) == [out.join("other.txt"), out.join("pushitems.jsonl")]
+    assert (
+        "Skipping pushcollector.db.files in %s: SQLite databases can't be merged"
+        % (in1)
+        in caplog.text
+    )
+
+
+def test_merge_binary(tmpdir):
+    """Binary push items can be read and written."""
+
+    in1 = make_input(tmpdir, "in1", [{"filename": "a", "state": "PENDING"}])
+    out = tmpdir.join("out")
+
+    merge_artifacts([in1], str(out), pushitems_format="binary")
+    merge_artifacts([str(out)], str(tmpdir.join("out2")))
+
+    assert list(read_push_items(str(out.join("pushitems.bin")))) == [
+        {"filename": "a", "state": "PENDING"}
+    ]
+    assert list(read_push_items(str(tmpdir.join("out2/pushitems.jsonl")))) == [
+        {"filename": "a", "state": "PENDING"}
+    ]
+
+
+def test_main(tmpdir, capsys):
+    """pushcollector-merge command merges inputs and prints counts per state."""
+
+    in1 = make_input(
+        tmpdir,
+        "in1",
+        [{"filename": "a", "state": "PENDING", "t": 2}],
+        {"push.log": "one\n"},
+    )
+    in2 = make_input(
+        tmpdir,
+        "in2",
+        [{"filename": "a", "state": "PUSHED", "t": 1}],
+        {"push.log": "two\n"},
+    )
+    out = tmpdir.join("out")
+
+    main([in1, in2, "-o", str(out), "--order-by", "t", "--append", "*.log"])
+
+    assert list(read_push_items(str(out.join("pushitems.jsonl")))) == [
+        {"filename": "a", "state": "PENDING", "t": 2}
+    ]
+    assert out.join("push.log").read() == "one\ntwo\n"
+    assert capsys.readouterr().out == "PENDING: 1\n"
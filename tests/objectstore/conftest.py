@@ -0,0 +1,92 @@
+import io
+import threading
+import uuid
+
+import pytest
+
+from pushcollector._impl.objectstore import ObjectStoreCollector
+
+
+class FakeS3Client(object):
+    """An in-process stand-in for a boto3 S3 client, implementing the subset
+    of the API used by the objectstore backend."""
+
+    def __init__(self, min_part_size):
+        self.min_part_size = min_part_size
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+        self.fail_parts = False
+        self.fail_puts = []
+        self.lock = threading.Lock()
+
+    def _record(self, method, bucket, key):
+        assert bucket == "test-bucket"
+        with self.lock:
+            self.calls.append((method, key))
+
+    def put_object(self, Bucket, Key, Body):
+        self._record("put_object", Bucket, Key)
+        if any(Key.startswith(prefix) for prefix in self.fail_puts):
+            raise RuntimeError("simulated upload failure")
+        self.objects[Key] = bytes(Body)
+        return {"ETag": uuid.uuid4().hex}
+
+    def get_object(self, Bucket, Key):
+        self._record("get_object", Bucket, Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self._record("copy_object", Bucket, Key)
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+    def delete_objects(self, Bucket, Delete):
+        self._record("delete_objects", Bucket, None)
+        for obj in Delete["Objects"]:
+            # Like S3, deleting a missing object is not an error
+            self.objects.pop(obj["Key"], None)
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._record("create_multipart_upload", Bucket, Key)
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._record("upload_part", Bucket, Key)
+        if self.fail_parts:
+            raise RuntimeError("simulated upload failure")
+        etag = uuid.uuid4().hex
+        self.uploads[UploadId][PartNumber] = (etag, bytes(Body))
+        return {"ETag": etag}
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource):
+        self._record("upload_part_copy", Bucket, Key)
+        etag = uuid.uuid4().hex
+        self.uploads[UploadId][PartNumber] = (etag, self.objects[CopySource["Key"]])
+        return {"CopyPartResult": {"ETag": etag}}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._record("complete_multipart_upload", Bucket, Key)
+        upload = self.uploads.pop(UploadId)
+        parts = MultipartUpload["Parts"]
+        assert [p["PartNumber"] for p in parts] == sorted(upload)
+        content = b""
+        for (i, part) in enumerate(parts):
+            (etag, data) = upload[part["PartNumber"]]
+            assert part["ETag"] == etag
+            if i != len(parts) - 1:
+                assert len(data) >= self.min_part_size, "part too small"
+            content += data
+        self.objects[Key] = content
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._record("abort_multipart_upload", Bucket, Key)
+        self.uploads.pop(UploadId, None)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # Use small parts so tests needn't handle MBs of data
+    monkeypatch.setattr(ObjectStoreCollector, "MIN_PART_SIZE", 10)
+    return FakeS3Client(min_part_size=10)
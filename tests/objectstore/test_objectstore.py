@@ -0,0 +1,184 @@
+import json
+import threading
+
+import pytest
+
+from pushcollector import Collector, ObjectStoreCollector
+
+
+@pytest.fixture
+def collector(s3):
+    Collector.register_backend(
+        "s3",
+        lambda: ObjectStoreCollector(
+            "test-bucket",
+            prefix="push/",
+            client=s3,
+            part_size=10,
+            batch_size=3,
+            flush_interval=60,
+        ),
+    )
+    yield Collector.get("s3")
+    Collector.register_backend("s3", None)
+
+
+def test_push_items_batched(s3, collector):
+    """Push items are uploaded in batches."""
+    items = [{"filename": "file%s" % i, "state": "PUSHED"} for i in range(5)]
+
+    with collector:
+        # The first 3 items form a complete batch, uploaded immediately
+        collector.update_push_items(items[:3]).result()
+        assert sorted(s3.objects) == ["push/pushitems/00000000.jsonl"]
+
+        # The rest are buffered
+        collector.update_push_items(items[3:])
+
+    # Remaining items were uploaded on exit
+    lines = []
+    for key in ["push/pushitems/00000000.jsonl", "push/pushitems/00000001.jsonl"]:
+        lines.extend(s3.objects[key].decode("utf-8").splitlines())
+    assert [json.loads(line) for line in lines] == items
+
+
+def test_push_items_flushed_periodically(s3):
+    """Push items are uploaded after flush_interval, even if batch is not full."""
+    collector = ObjectStoreCollector(
+        "test-bucket", prefix="push/", client=s3, part_size=10, flush_interval=0.01
+    )
+    collector.update_push_items([{"filename": "file", "state": "PUSHED"}]).result(
+        timeout=5
+    )
+    assert "push/pushitems/00000000.jsonl" in s3.objects
+    collector.__exit__(None, None, None)
+
+
+def test_attach_multipart(s3, collector):
+    """Large attachments are uploaded in parts."""
+    content = bytes(range(45))
+
+    collector.attach_file("small.bin", b"abc").result()
+    collector.attach_file("big.bin", content).result()
+
+    assert s3.objects["push/small.bin"] == b"abc"
+    assert s3.objects["push/big.bin"] == content
+
+    methods = [method for (method, key) in s3.calls if key == "push/big.bin"]
+    assert methods.count("upload_part") == 5
+    assert methods[-1] == "complete_multipart_upload"
+
+
+def test_attach_multipart_failure(s3, collector):
+    """Failed multipart upload is aborted and propagates error."""
+    s3.fail_parts = True
+
+    exception = collector.attach_file("big.bin", bytes(45)).exception()
+
+    assert "simulated upload failure" in str(exception)
+    assert "push/big.bin" not in s3.objects
+    assert s3.uploads == {}
+
+
+def test_append_composed(s3, collector):
+    """Appended content is uploaded as parts, composed on exit."""
+    with collector:
+        # Small appends are buffered
+        collector.append_file("log.txt", "line 1\n")
+        collector.append_file("log.txt", "line 2\n").result()
+        # Small part flushed early (as if by flush_interval)
+        collector.append_file("log.txt", "line 3\n")
+        collector._delegate._flush()
+        collector.append_file("log.txt", "line 4\nline 5\nline 6\n").result()
+        collector.append_file("other.txt", "hello")
+
+    assert s3.objects["push/log.txt"] == (
+        b"line 1\nline 2\nline 3\nline 4\nline 5\nline 6\n"
+    )
+    assert s3.objects["push/other.txt"] == b"hello"
+
+    # Temporary parts are removed
+    assert not [key for key in s3.objects if "/.parts/" in key]
+
+    # Appending after exit continues from the composed object
+    with collector:
+        collector.append_file("log.txt", "line 7\n")
+
+    assert s3.objects["push/log.txt"].endswith(b"line 6\nline 7\n")
+
+
+def test_part_size_too_small(s3):
+    """part_size must be large enough for multipart uploads."""
+    with pytest.raises(ValueError):
+        ObjectStoreCollector("test-bucket", client=s3, part_size=5)
+
+
+def test_append_after_attach(s3, collector):
+    """Content appended to an attached file follows the attached content."""
+    with collector:
+        collector.attach_file("log.txt", "header\n")
+        collector.append_file("log.txt", "line 1\n")
+        collector.append_file("log.txt", "line 2, which fills a part\n")
+
+    assert s3.objects["push/log.txt"] == b"header\nline 1\nline 2, which fills a part\n"
+    assert not [key for key in s3.objects if "/.parts/" in key]
+
+
+def test_attach_after_append(s3, collector):
+    """Attaching a file replaces anything previously appended to it."""
+    with collector:
+        collector.append_file("log.txt", "line 1\n")
+        collector.append_file("log.txt", "line 2, which fills a part\n").result()
+        collector.append_file("log.txt", "line 3\n")
+        collector.attach_file("log.txt", "replaced\n").result()
+
+    assert s3.objects["push/log.txt"] == b"replaced\n"
+    assert not [key for key in s3.objects if "/.parts/" in key]
+
+
+def test_compose_failure(s3, collector):
+    """A file which can't be composed doesn't prevent composing others, and
+    leaves no incomplete uploads or parts behind."""
+    with pytest.raises(KeyError):
+        with collector:
+            collector.append_file("a.log", "abc")
+            collector._delegate._flush()
+            collector.append_file("a.log", "a part of a.log\n").result()
+            collector.append_file("b.log", "b\n")
+
+            # Lose the first part of a.log
+            del s3.objects["push/.parts/a.log/00000000"]
+
+    assert "push/a.log" not in s3.objects
+    assert s3.objects["push/b.log"] == b"b\n"
+    assert s3.uploads == {}
+    assert not [key for key in s3.objects if "/.parts/" in key]
+
+
+def test_failed_part_not_composed(s3, collector, caplog):
+    """A file with parts which failed to upload is not composed."""
+    s3.fail_puts = ["push/.parts/a.log/"]
+
+    with collector:
+        failed = collector.append_file("a.log", "a part of a.log\n")
+        collector.append_file("a.log", "more")
+        collector.append_file("b.log", "b\n")
+
+    assert "simulated upload failure" in str(failed.exception())
+    assert "push/a.log" not in s3.objects
+    assert s3.objects["push/b.log"] == b"b\n"
+    assert not [key for key in s3.objects if "/.parts/" in key]
+    assert "Not composing push/a.log since some parts failed to upload" in caplog.text
+
+
+def test_threads_stopped_on_exit(s3, collector):
+    """No upload threads remain after exit."""
+    with collector:
+        collector.attach_file("file.txt", "x" * 50).result()
+        collector.update_push_items([{"filename": "a", "state": "PENDING"}])
+
+    assert not [
+        thread
+        for thread in threading.enumerate()
+        if "pushcollector-objectstore" in thread.name
+    ]
@@ -0,0 +1,29 @@
+import pytest
+
+from pushcollector import Collector
+
+
+@pytest.fixture
+def mock_backend():
+    """Registers a "test" backend recording push items and attached files.
+
+    The most recently created instance is available as ``INSTANCE``.
+    """
+
+    class TestCollector(object):
+        INSTANCE = None
+
+        def __init__(self):
+            TestCollector.INSTANCE = self
+            self.items = []
+            self.files = {}
+
+        def update_push_items(self, items):
+            self.items.extend(items)
+
+        def attach_file(self, filename, content):
+            self.files[filename] = content
+
+    Collector.register_backend("test", TestCollector)
+    yield TestCollector
+    Collector.register_backend("test", None)
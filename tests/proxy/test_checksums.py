@@ -0,0 +1,288 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import jsonschema
+import pytest
+
+from pushcollector import Collector, ChecksumCache
+from pushcollector._impl import checksums
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    calls = []
+    orig_hash_file = checksums.hash_file
+
+    def hash_file(path):
+        calls.append(path)
+        return orig_hash_file(path)
+
+    monkeypatch.setattr(checksums, "hash_file", hash_file)
+    return calls
+
+
+def expected_checksums(content):
+    return {
+        "md5": hashlib.md5(content).hexdigest(),
+        "sha256": hashlib.sha256(content).hexdigest(),
+    }
+
+
+def test_fills_checksums(mock_backend, tmpdir):
+    """Missing checksums are calculated from src."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+
+    with Collector.get("test", checksum_cache=cache) as collector:
+        collector.update_push_items(
+            [{"filename": "file.txt", "state": "PENDING", "src": str(src)}]
+        ).result()
+
+    assert mock_backend.INSTANCE.items == [
+        {
+            "filename": "file.txt",
+            "state": "PENDING",
+            "src": str(src),
+            "checksums": expected_checksums(b"some content"),
+        }
+    ]
+
+
+def test_multi_chunk_file(tmpdir, monkeypatch):
+    """Files larger than a single chunk are hashed correctly."""
+
+    monkeypatch.setattr(checksums, "CHUNK_SIZE", 7)
+    content = os.urandom(100)
+    src = tmpdir.join("file.bin")
+    src.write_binary(content)
+
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+    assert cache.get([str(src)]).result() == {str(src): expected_checksums(content)}
+
+
+def test_empty_file(tmpdir):
+    """Empty files can be hashed."""
+
+    src = tmpdir.join("empty")
+    src.write_binary(b"")
+
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+    assert cache.get([str(src)]).result() == {str(src): expected_checksums(b"")}
+
+
+def test_cache_reused(tmpdir, hash_calls):
+    """Unchanged files are hashed only once, even across cache instances."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    db = str(tmpdir.join("cache.db"))
+
+    first = ChecksumCache(db).get([str(src)]).result()
+    second = ChecksumCache(db).get([str(src)]).result()
+
+    assert first == second
+    assert hash_calls == [str(src)]
+
+
+def test_modified_file_rehashed(tmpdir, hash_calls):
+    """Files modified since being cached are hashed again."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+    cache.get([str(src)]).result()
+
+    src.write_binary(b"other content, of different size")
+
+    assert cache.get([str(src)]).result() == {
+        str(src): expected_checksums(b"other content, of different size")
+    }
+    assert hash_calls == [str(src), str(src)]
+
+
+def test_unusable_src_ignored(mock_backend, tmpdir):
+    """Items with src not referring to a regular file are left as-is."""
+
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+
+    with Collector.get("test", checksum_cache=cache) as collector:
+        collector.update_push_items(
+            [
+                {"filename": "a", "state": "PENDING", "src": str(tmpdir.join("a"))},
+                {"filename": "b", "state": "PENDING", "src": str(tmpdir)},
+                {"filename": "c", "state": "PENDING"},
+            ]
+        ).result()
+
+    assert [item.get("checksums") for item in mock_backend.INSTANCE.items] == [
+        None,
+        None,
+        None,
+    ]
+
+
+def test_existing_checksums_kept(mock_backend, tmpdir, hash_calls):
+    """Items which already have checksums are not hashed or modified."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+    item = {
+        "filename": "file.txt",
+        "state": "PENDING",
+        "src": str(src),
+        "checksums": {"md5": "0" * 32},
+    }
+
+    with Collector.get("test", checksum_cache=cache) as collector:
+        collector.update_push_items([item]).result()
+
+    assert mock_backend.INSTANCE.items == [item]
+    assert hash_calls == []
+
+
+def test_input_not_modified(mock_backend, tmpdir):
+    """Checksums are added to copies of the caller's push items."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+    item = {"filename": "file.txt", "state": "PENDING", "src": str(src)}
+
+    with Collector.get("test", checksum_cache=cache) as collector:
+        collector.update_push_items([item]).result()
+
+    assert item == {"filename": "file.txt", "state": "PENDING", "src": str(src)}
+    assert mock_backend.INSTANCE.items[0]["checksums"]
+
+
+def test_hashing_does_not_block(mock_backend, tmpdir, monkeypatch):
+    """update_push_items returns while files are hashed, and push items reach
+    the backend in the order of calls."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+
+    release = threading.Event()
+    orig_hash_file = checksums.hash_file
+
+    def blocking_hash_file(path):
+        release.wait()
+        return orig_hash_file(path)
+
+    monkeypatch.setattr(checksums, "hash_file", blocking_hash_file)
+
+    with Collector.get("test", checksum_cache=cache) as collector:
+        first = collector.update_push_items(
+            [{"filename": "file.txt", "state": "PENDING", "src": str(src)}]
+        )
+        second = collector.update_push_items([{"filename": "other", "state": "PUSHED"}])
+
+        # Nothing reaches the backend until hashing completes
+        assert not first.done()
+        assert not second.done()
+        assert mock_backend.INSTANCE.items == []
+
+        release.set()
+        second.result()
+
+    assert [item["filename"] for item in mock_backend.INSTANCE.items] == [
+        "file.txt",
+        "other",
+    ]
+    assert mock_backend.INSTANCE.items[0]["checksums"]
+
+
+def test_invalid_items_not_hashed(mock_backend, tmpdir, hash_calls):
+    """Push items are validated before any files are hashed."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+
+    collector = Collector.get("test", checksum_cache=cache)
+    with pytest.raises(jsonschema.ValidationError):
+        collector.update_push_items(
+            [{"filename": "file.txt", "state": "BAD", "src": str(src)}]
+        )
+
+    assert hash_calls == []
+
+
+def test_unusable_cache(mock_backend, tmpdir, caplog):
+    """Checksums are calculated without the cache if it can't be opened."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    tmpdir.join("not-a-dir").write("")
+    cache = ChecksumCache(str(tmpdir.join("not-a-dir", "cache.db")))
+
+    with Collector.get("test", checksum_cache=cache) as collector:
+        collector.update_push_items(
+            [{"filename": "file.txt", "state": "PENDING", "src": str(src)}]
+        ).result()
+        assert collector.summary()["total"] == 1
+
+    assert mock_backend.INSTANCE.items[0]["checksums"] == expected_checksums(
+        b"some content"
+    )
+    assert "Can't read checksum cache" in caplog.text
+
+
+def test_cache_store_fails(mock_backend, tmpdir, monkeypatch, caplog):
+    """Push items still reach the backend if checksums can't be cached."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+    cache = ChecksumCache(str(tmpdir.join("cache.db")))
+
+    class LockedConnection(object):
+        def __init__(self, conn):
+            self._conn = conn
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+        def __enter__(self):
+            return self._conn.__enter__()
+
+        def __exit__(self, *args):
+            return self._conn.__exit__(*args)
+
+        def executemany(self, *_):
+            raise sqlite3.OperationalError("database is locked")
+
+    orig_connect = cache._connect
+    monkeypatch.setattr(cache, "_connect", lambda: LockedConnection(orig_connect()))
+
+    with Collector.get("test", checksum_cache=cache) as collector:
+        collector.update_push_items(
+            [{"filename": "file.txt", "state": "PENDING", "src": str(src)}]
+        ).result()
+
+    assert mock_backend.INSTANCE.items[0]["checksums"] == expected_checksums(
+        b"some content"
+    )
+    assert "Can't update checksum cache" in caplog.text
+    assert "database is locked" in caplog.text
+
+
+def test_close(tmpdir):
+    """Cache can be used as a context manager, which closes it."""
+
+    src = tmpdir.join("file.txt")
+    src.write_binary(b"some content")
+
+    with ChecksumCache(str(tmpdir.join("cache.db"))) as cache:
+        assert cache.get([str(src)]).result()
+
+    # Connection and thread pool were released
+    assert cache._conn is None
+    tmpdir.join("other.txt").write_binary(b"other content")
+    with pytest.raises(RuntimeError):
+        cache.get([str(tmpdir.join("other.txt"))])
@@ -0,0 +1,141 @@
+import json
+
+import pytest
+
+from pushcollector import Collector
+from pushcollector._impl import summary
+from pushcollector._impl.schema import read_schema
+
+
+def test_summary_tracks_latest_state(mock_backend):
+    """summary reflects only the latest state of each (filename, dest)."""
+
+    with Collector.get("test") as collector:
+        collector.update_push_items(
+            [
+                {"filename": "a", "state": "PENDING", "dest": "d1", "build": "b-1"},
+                {"filename": "a", "state": "PENDING", "dest": "d2", "build": "b-1"},
+                {"filename": "b", "state": "PENDING"},
+            ]
+        )
+        collector.update_push_items(
+            [
+                {"filename": "a", "state": "PUSHED", "dest": "d1", "build": "b-1"},
+                {"filename": "a", "state": "UPLOADFAILED", "dest": "d2"},
+                {"filename": "b", "state": "NOTFOUND"},
+            ]
+        )
+
+        summary = collector.summary()
+        assert summary == {
+            "total": 3,
+            "states": {"PUSHED": 1, "UPLOADFAILED": 1, "NOTFOUND": 1},
+            "successful": {"PUSHED": 1},
+            "unsuccessful": {"UPLOADFAILED": 1, "NOTFOUND": 1},
+            "builds": {"b-1": {"PUSHED": 1}},
+            "dests": {"d1": {"PUSHED": 1}, "d2": {"UPLOADFAILED": 1}},
+            "failures": [
+                {"filename": "a", "dest": "d2", "state": "UPLOADFAILED"},
+                {"filename": "b", "dest": None, "state": "NOTFOUND"},
+            ],
+        }
+
+        # A failed item can later succeed
+        collector.update_push_items([{"filename": "b", "state": "PUSHED"}])
+        summary = collector.summary()
+        assert summary["states"] == {"PUSHED": 2, "UPLOADFAILED": 1}
+        assert summary["failures"] == [
+            {"filename": "a", "dest": "d2", "state": "UPLOADFAILED"}
+        ]
+
+    # On exit, the summary was attached via the backend
+    attached = mock_backend.INSTANCE.files["summary.json"]
+    assert json.loads(attached.decode("utf-8")) == summary
+
+
+def test_no_summary_without_items(mock_backend):
+    """summary.json is not attached if no push items were recorded."""
+
+    with Collector.get("test") as collector:
+        assert collector.summary()["total"] == 0
+
+    assert mock_backend.INSTANCE.files == {}
+
+
+def test_summary_failure_exits_backend():
+    """Backend is exited even if the summary can't be written."""
+
+    class FailingCollector(object):
+        EXITED = []
+
+        def update_push_items(self, items):
+            pass
+
+        def attach_file(self, filename, content):
+            raise RuntimeError("attach fail")
+
+        def __exit__(self, *args):
+            FailingCollector.EXITED.append(args)
+
+    Collector.register_backend("failing", FailingCollector)
+    try:
+        with pytest.raises(RuntimeError) as excinfo:
+            with Collector.get("failing") as collector:
+                collector.update_push_items([{"filename": "a", "state": "PENDING"}])
+    finally:
+        Collector.register_backend("failing", None)
+
+    assert str(excinfo.value) == "attach fail"
+    assert FailingCollector.EXITED == [(None, None, None)]
+
+
+def test_summary_failure_keeps_original_error():
+    """An error writing the summary doesn't replace the error which caused
+    the collector to exit."""
+
+    class FailingCollector(object):
+        def update_push_items(self, items):
+            pass
+
+        def attach_file(self, filename, content):
+            raise RuntimeError("attach fail")
+
+    Collector.register_backend("failing", FailingCollector)
+    try:
+        with pytest.raises(KeyError):
+            with Collector.get("failing") as collector:
+                collector.update_push_items([{"filename": "a", "state": "PENDING"}])
+                raise KeyError("original")
+    finally:
+        Collector.register_backend("failing", None)
+
+
+def test_no_summary_without_attach_file():
+    """Backends without attach_file can be used as a context manager."""
+
+    class ItemsOnlyCollector(object):
+        def update_push_items(self, items):
+            pass
+
+    Collector.register_backend("items-only", ItemsOnlyCollector)
+    try:
+        with Collector.get("items-only") as collector:
+            collector.update_push_items([{"filename": "a", "state": "PENDING"}])
+    finally:
+        Collector.register_backend("items-only", None)
+
+    assert collector.summary()["total"] == 1
+
+
+def test_all_states_classified():
+    """Every state in the schema is classified as successful or not.
+
+    If this fails, add the new state to summary.SUCCESSFUL_STATES or
+    summary.UNSUCCESSFUL_STATES."""
+
+    schema_states = read_schema("pushitem.yaml")["properties"]["state"]["enum"]
+
+    assert not summary.SUCCESSFUL_STATES & summary.UNSUCCESSFUL_STATES
+    assert set(schema_states) == (
+        summary.SUCCESSFUL_STATES | summary.UNSUCCESSFUL_STATES
+    )
@@ -0,0 +1,118 @@
+import json
+
+from more_executors.futures import f_return, f_return_error
+
+from pushcollector import Collector
+from pushcollector._impl.trace import Tracer
+
+
+def test_trace_written_on_exit(tmpdir):
+    """Collector obtained with trace writes a Chrome trace of each call
+    on exit."""
+
+    class TestCollector(object):
+        def update_push_items(self, items):
+            return f_return()
+
+        def attach_file(self, filename, content):
+            return f_return()
+
+        def append_file(self, filename, content):
+            return f_return_error(RuntimeError("oops"))
+
+    Collector.register_backend("test", TestCollector)
+    trace_path = tmpdir.join("trace.json")
+
+    try:
+        with Collector.get("test", trace=str(trace_path)) as collector:
+            collector.update_push_items(
+                [
+                    {"filename": "file1", "state": "PUSHED"},
+                    {"filename": "file2", "state": "PUSHED"},
+                ]
+            ).result()
+            collector.attach_file("somefile", "abc").result()
+            collector.append_file("otherfile", b"de").exception()
+    finally:
+        Collector.register_backend("test", None)
+
+    events = json.loads(trace_path.read())["traceEvents"]
+    summary_bytes = len(json.dumps(collector.summary(), sort_keys=True, indent=2))
+
+    complete = [(e["name"], e["args"]) for e in events if e["ph"] == "X"]
+
+    # Phases are recorded before their enclosing span
+    assert complete == [
+        ("translate", {}),
+        ("validate", {}),
+        ("submit", {}),
+        ("summarize", {}),
+        ("update_push_items", {"items": 2}),
+        ("translate", {}),
+        ("submit", {}),
+        ("attach_file", {"filename": "somefile", "bytes": 3}),
+        ("translate", {}),
+        ("submit", {}),
+        ("append_file", {"filename": "otherfile", "bytes": 2}),
+        # summary written on exit
+        ("translate", {}),
+        ("submit", {}),
+        ("attach_file", {"filename": "summary.json", "bytes": summary_bytes}),
+    ]
+
+    # Future resolution is recorded as a begin/end pair per call
+    resolved = [(e["ph"], e["name"], e["id"], e["args"]) for e in events if "id" in e]
+    assert resolved == [
+        ("b", "update_push_items", 0, {"items": 2}),
+        ("e", "update_push_items", 0, {}),
+        ("b", "attach_file", 1, {"bytes": 3}),
+        ("e", "attach_file", 1, {}),
+        ("b", "append_file", 2, {"bytes": 2}),
+        ("e", "append_file", 2, {"error": "RuntimeError('oops')"}),
+        ("b", "attach_file", 3, {"bytes": summary_bytes}),
+        ("e", "attach_file", 3, {}),
+    ]
+
+    for event in events:
+        assert isinstance(event["tid"], int)
+        assert isinstance(event["ts"], float)
+
+
+def test_no_trace_by_default(tmpdir, monkeypatch):
+    """Collector doesn't write any trace unless requested."""
+    monkeypatch.chdir(tmpdir)
+
+    with Collector.get("dummy") as collector:
+        collector.attach_file("somefile", "abc").result()
+
+    assert tmpdir.listdir() == []
+
+
+def test_trace_dropped_events(tmpdir, caplog):
+    """A warning is logged if the trace had to drop events."""
+    trace_path = tmpdir.join("trace.json")
+    tracer = Tracer(str(trace_path), capacity=3)
+
+    for i in range(5):
+        with tracer.span("span%s" % i):
+            pass
+    tracer.write()
+
+    events = json.loads(trace_path.read())["traceEvents"]
+    assert [e["name"] for e in events] == ["span2", "span3", "span4"]
+    assert (
+        "Collector trace %s is incomplete: the oldest 2 event(s) were dropped"
+        % trace_path
+    ) in caplog.text
+
+
+def test_trace_complete_no_warning(tmpdir, caplog):
+    """No warning is logged if the trace holds every event."""
+    tracer = Tracer(str(tmpdir.join("trace.json")), capacity=3)
+
+    for i in range(3):
+        with tracer.span("span%s" % i):
+            pass
+    tracer.write()
+
+    assert "incomplete" not in caplog.text
@@ -0,0 +1,57 @@
+import jsonschema
+import pytest
+
+from pushcollector._impl.proxy import CollectorProxy
+
+VALID = [
+    {"filename": "f", "state": "PUSHED"},
+    {"filename": "f", "state": "PUSHED", "src": None, "dest": "d", "build": "b"},
+    {"filename": "f", "state": "NOTFOUND", "checksums": None},
+    {"filename": "f", "state": "NOTFOUND", "checksums": {}},
+    {"filename": "f", "state": "EXISTS", "checksums": {"md5": "a" * 32}},
+    {"filename": "f", "state": "EXISTS", "checksums": {"sha256": "0" * 64}},
+    {"filename": "f", "state": "PUSHED", "extra": "allowed by schema"},
+]
+
+INVALID = [
+    {"filename": "f"},
+    {"state": "PUSHED"},
+    {"filename": 1, "state": "PUSHED"},
+    {"filename": "f", "state": "BAD"},
+    {"filename": "f", "state": "PUSHED", "dest": ["d"]},
+    {"filename": "f", "state": "PUSHED", "checksums": "abc"},
+    {"filename": "f", "state": "PUSHED", "checksums": {"md5": "A" * 32}},
+    {"filename": "f", "state": "PUSHED", "checksums": {"md5": "a" * 31}},
+    {"filename": "f", "state": "PUSHED", "checksums": {"sha1": "a" * 40}},
+    {"filename": "f", "state": "PUSHED", "checksums": {"sha256": "g" * 64}},
+]
+
+
+@pytest.mark.parametrize("item", VALID + INVALID)
+def test_fast_check_agrees_with_schema(item):
+    """Fast check never accepts an item which the schema rejects."""
+    valid = CollectorProxy._ITEM_VALIDATOR.is_valid(item)
+    assert valid == (item in VALID)
+
+    if CollectorProxy._ITEM_CHECK(item):
+        assert valid
+
+
+@pytest.mark.parametrize("item", INVALID)
+def test_invalid_items_rejected(item):
+    """Invalid items still raise a validation error."""
+    with pytest.raises(jsonschema.ValidationError):
+        CollectorProxy(object()).update_push_items([item])
+
+
+def test_fast_check_accepts_common_items():
+    """Fast check accepts typical items, so they skip jsonschema."""
+    assert CollectorProxy._ITEM_CHECK(
+        {
+            "filename": "f",
+            "state": "PUSHED",
+            "src": "/some/f",
+            "dest": "d",
+            "checksums": {"md5": "a" * 32, "sha256": "0" * 64},
+        }
+    )
@@ -0,0 +1,172 @@
+import threading
+
+import pytest
+from more_executors.futures import f_return_error
+
+from pushcollector import Collector, PriorityScheduler
+
+
+class BlockingCollector(object):
+    # A backend recording the order of calls; calls block until released.
+    def __init__(self):
+        self.calls = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def update_push_items(self, items):
+        self.release.wait()
+        self.calls.append(("update_push_items", items[0]["filename"]))
+
+    def attach_file(self, filename, content):
+        self.entered.set()
+        self.release.wait()
+        self.calls.append(("attach_file", filename))
+
+    def append_file(self, filename, content):
+        self.release.wait()
+        self.calls.append(("append_file", filename))
+        return f_return_error(RuntimeError("append failed"))
+
+
+@pytest.fixture
+def backend():
+    backend = BlockingCollector()
+    Collector.register_backend("blocking", lambda: backend)
+    yield backend
+    Collector.register_backend("blocking", None)
+
+
+def schedule_mixed(collector, backend):
+    # Once the first call is running, the rest are queued
+    fs = [collector.attach_file("big1", "x")]
+    backend.entered.wait()
+
+    fs.append(collector.attach_file("big2", "x"))
+    fs.append(collector.append_file("log", "x"))
+    for i in range(3):
+        fs.append(
+            collector.update_push_items([{"filename": str(i), "state": "PUSHED"}])
+        )
+    return fs
+
+
+def test_priority_order(backend):
+    """Scheduled calls run in priority order."""
+    scheduler = PriorityScheduler(workers=1)
+    collector = Collector.get("blocking", scheduler=scheduler)
+
+    fs = schedule_mixed(collector, backend)
+    stats = scheduler.stats()
+    assert stats["update_push_items"]["queued"] == 3
+    assert stats["attach_file"]["running"] == 1
+
+    backend.release.set()
+    scheduler.shutdown()
+
+    # The first call was already running, then the rest are run by priority
+    assert backend.calls == [
+        ("attach_file", "big1"),
+        ("update_push_items", "0"),
+        ("update_push_items", "1"),
+        ("update_push_items", "2"),
+        ("append_file", "log"),
+        ("attach_file", "big2"),
+    ]
+
+    # Futures are resolved with the backend's result
+    assert fs[0].result() is None
+    assert str(fs[2].exception()) == "append failed"
+
+    stats = scheduler.stats()
+    assert stats["update_push_items"] == {
+        "queued": 0,
+        "running": 0,
+        "completed": 3,
+        "max_queued": 3,
+    }
+
+    with pytest.raises(RuntimeError):
+        collector.attach_file("more", "x")
+
+
+def test_fairness(backend):
+    """Lower priority calls are not starved."""
+    scheduler = PriorityScheduler(workers=1, fairness=1)
+    collector = Collector.get("blocking", scheduler=scheduler)
+
+    schedule_mixed(collector, backend)
+    backend.release.set()
+    scheduler.shutdown()
+
+    assert backend.calls == [
+        ("attach_file", "big1"),
+        ("update_push_items", "0"),
+        ("append_file", "log"),
+        ("attach_file", "big2"),
+        ("update_push_items", "1"),
+        ("update_push_items", "2"),
+    ]
+
+
+def test_exit_waits(backend):
+    """Exiting a collector waits for all scheduled calls."""
+    scheduler = PriorityScheduler(limits={"attach_file": 2})
+
+    with Collector.get("blocking", scheduler=scheduler) as collector:
+        schedule_mixed(collector, backend)
+        threading.Timer(0.1, backend.release.set).start()
+
+    # summary.json is attached on exit too
+    assert len(backend.calls) == 7
+    scheduler.shutdown()
+
+
+def test_same_file_in_order(tmpdir, monkeypatch):
+    """Calls writing to the same file run in the order they were made,
+    across lanes, while other files are unaffected."""
+    monkeypatch.chdir(tmpdir)
+
+    class RecordingCollector(object):
+        def __init__(self):
+            self.files = {}
+            self.calls = []
+            self.entered = threading.Event()
+            self.release = threading.Event()
+
+        def attach_file(self, filename, content):
+            if filename == "blocker":
+                self.entered.set()
+                self.release.wait()
+            self.calls.append(("attach_file", filename))
+            self.files[filename] = content
+
+        def append_file(self, filename, content):
+            self.calls.append(("append_file", filename))
+            self.files[filename] = self.files.get(filename, b"") + content
+
+    backend = RecordingCollector()
+    Collector.register_backend("recording", lambda: backend)
+    try:
+        scheduler = PriorityScheduler(workers=2)
+        collector = Collector.get("recording", scheduler=scheduler)
+
+        # Keep one worker busy, so queued calls are dispatched together
+        collector.attach_file("blocker", "x")
+        backend.entered.wait()
+
+        collector.attach_file("log", "header\n")
+        collector.append_file("log", "line\n")
+        collector.attach_file("other", "1")
+        collector.attach_file("file", "first")
+        collector.attach_file("file", "second")
+
+        backend.release.set()
+        scheduler.shutdown()
+    finally:
+        Collector.register_backend("recording", None)
+
+    assert backend.files["log"] == b"header\nline\n"
+    assert backend.files["file"] == b"second"
+    assert backend.calls.index(("attach_file", "log")) < backend.calls.index(
+        ("append_file", "log")
+    )
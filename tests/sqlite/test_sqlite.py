@@ -0,0 +1,129 @@
+import json
+import sqlite3
+
+import pytest
+
+from pushcollector import Collector, SqliteCollector
+
+
+@pytest.fixture
+def db_path(tmpdir):
+    path = str(tmpdir.join("push.db"))
+    Collector.register_backend(
+        "sqlite-test",
+        lambda: SqliteCollector(path=path, history=True, blob_threshold=10),
+    )
+    yield path
+    Collector.register_backend("sqlite-test", None)
+
+
+def query(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_default_path(tmpdir, monkeypatch):
+    """sqlite backend is registered by default, writing to artifacts dir."""
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(SqliteCollector, "timestamp", lambda cls: "time1")
+
+    with Collector.get("sqlite") as collector:
+        collector.update_push_items([{"filename": "f", "state": "PUSHED"}]).result()
+
+    path = str(tmpdir.join("artifacts", "time1", "pushcollector.db"))
+    assert query(path, "SELECT filename, state FROM push_items") == [("f", "PUSHED")]
+    assert query(path, "PRAGMA journal_mode") == [("wal",)]
+
+
+def test_push_items_upserted(db_path):
+    """Latest state per (filename, dest) is kept, with optional history."""
+    checksums = {"md5": "bb1b0d528129f47798006e73307ba7a7"}
+
+    with Collector.get("sqlite-test") as collector:
+        collector.update_push_items(
+            [
+                {"filename": "a", "state": "PENDING"},
+                {"filename": "a", "state": "PENDING", "dest": "d1"},
+                {"filename": "a", "state": "PENDING", "dest": "d2"},
+            ]
+        ).result()
+        collector.update_push_items(
+            [
+                {"filename": "a", "state": "PUSHED", "build": "b-1"},
+                {
+                    "filename": "a",
+                    "state": "NOTFOUND",
+                    "dest": "d2",
+                    "checksums": checksums,
+                },
+            ]
+        ).result()
+
+    assert query(
+        db_path,
+        "SELECT filename, dest, state, build, checksums FROM push_items "
+        "ORDER BY dest",
+    ) == [
+        ("a", None, "PUSHED", "b-1", None),
+        ("a", "d1", "PENDING", None, None),
+        ("a", "d2", "NOTFOUND", None, json.dumps(checksums)),
+    ]
+
+    assert query(
+        db_path, "SELECT seq, dest, state FROM push_item_history ORDER BY seq"
+    ) == [
+        (1, None, "PENDING"),
+        (2, "d1", "PENDING"),
+        (3, "d2", "PENDING"),
+        (4, None, "PUSHED"),
+        (5, "d2", "NOTFOUND"),
+    ]
+
+    indexes = [row[1] for row in query(db_path, "PRAGMA index_list(push_items)")]
+    for name in ["push_items_state", "push_items_build", "push_items_origin"]:
+        assert name in indexes
+
+
+def test_attachments(db_path, tmpdir):
+    """Small files are stored as blobs, large files externally."""
+
+    with Collector.get("sqlite-test") as collector:
+        collector.attach_file("small.bin", b"\x00\x01").result()
+        collector.attach_file("big.txt", "0123456789abc").result()
+        collector.append_file("log.txt", "line 1\n").result()
+        # Outgrows threshold
+        collector.append_file("log.txt", "line 2\n").result()
+        collector.append_file("log.txt", "line 3\n").result()
+        # Replaced with smaller content
+        collector.attach_file("big.txt", "0").result()
+
+    rows = dict(
+        (row[0], row[1:])
+        for row in query(
+            db_path, "SELECT filename, size, content, path FROM attachments"
+        )
+    )
+    assert rows["small.bin"] == (2, b"\x00\x01", None)
+    assert rows["big.txt"] == (1, b"0", None)
+
+    log_path = str(tmpdir.join("push.db.files", "log.txt"))
+    assert rows["log.txt"] == (21, None, log_path)
+    assert tmpdir.join("push.db.files", "log.txt").read() == (
+        "line 1\nline 2\nline 3\n"
+    )
+    assert not tmpdir.join("push.db.files", "big.txt").exists()
+
+
+def test_old_sqlite(db_path, monkeypatch):
+    """A clear error is raised if SQLite is too old for the backend."""
+    monkeypatch.setattr(sqlite3, "sqlite_version_info", (3, 22, 0))
+    monkeypatch.setattr(sqlite3, "sqlite_version", "3.22.0")
+
+    with pytest.raises(RuntimeError) as excinfo:
+        SqliteCollector(db_path)
+
+    assert "requires SQLite 3.24.0 or later" in str(excinfo.value)
+    assert "uses SQLite 3.22.0" in str(excinfo.value)